@@ -0,0 +1,160 @@
+"""
+Automatic gain and integration-time control for the TCS34725
+"""
+
+# Integration time in tenths of a ms and the number of 2.4 ms ADC cycles, per TCS34725 setting
+_INTEGRATION_TENTHS = (24, 240, 1010, 1540, 7000)
+_INTEGRATION_MS = (2.4, 24, 101, 154, 700)
+_INTEGRATION_CYCLES = (1, 10, 42, 64, 256)
+_GAINS = (1, 4, 16, 60)
+
+
+class AutoExposure:
+
+    def __init__(self, sensor, low: float = 0.1, high: float = 0.9, min_full_scale: int = 1024,
+                 reference_ms: float = 24, reference_gain: int = 4):
+        """Keep the clear channel of a TCS34725 inside a target band.
+
+        Chooses the shortest integration time, and then the gain, that lands the clear channel
+        well inside the band. Nothing changes while the clear count stays inside [low, high] of
+        full scale, and a new setting has to land at least 1.5x away from both edges, so the
+        controller does not hunt between neighbouring settings. Gain steps are up to 4x, so the
+        default band has room for that. The first two samples after a change are ignored while
+        the sensor settles.
+
+        Works with the sensor in background sampling mode (reads latest()) or without it
+        (calls read_rgbc(), which blocks for one integration cycle).
+
+        Args:
+            sensor: The TCS34725 to control
+            low: Lower edge of the target band as a fraction of full scale
+            high: Upper edge of the target band as a fraction of full scale
+            min_full_scale: Smallest full-scale count accepted, which rules out integration
+                times too short to resolve colors (1024 allows every setting, 10240 needs at least 24 ms)
+            reference_ms: Integration time that normalized() scales counts to
+            reference_gain: Gain that normalized() scales counts to
+        """
+        self.sensor = sensor
+        self.low = low
+        self.high = high
+        self.min_full_scale = min_full_scale
+        self._reference = int(reference_ms * 10) * reference_gain
+        # Where a new setting should put the clear channel
+        self._land_low = low * 1.5
+        self._land_high = high / 1.5
+        self._target = (low * high) ** 0.5
+
+        self._time_index = _INTEGRATION_MS.index(sensor.get_integration_time())
+        self._gain_index = _GAINS.index(sensor.get_gain())
+        self._ready_at = 0
+        self._reads = 0
+        self._last = (0, 0, 0, 0)
+        self._last_exposure = self._exposure(self._time_index, self._gain_index)
+
+        # Counters
+        self.changes = 0
+        self.saturated = 0
+
+    def _full_scale(self, time_index):
+        return min(65535, 1024 * _INTEGRATION_CYCLES[time_index])
+
+    def _exposure(self, time_index, gain_index):
+        return _INTEGRATION_TENTHS[time_index] * _GAINS[gain_index]
+
+    def _sample_count(self):
+        return self.sensor.samples if self.sensor.is_sampling() else self._reads
+
+    def _read(self):
+        if self.sensor.is_sampling():
+            sample = self.sensor.latest()
+            return None if sample is None else sample[:4]
+        self._reads += 1
+        return self.sensor.read_rgbc()
+
+    def _choose(self, brightness, too_bright):
+        # brightness is clear counts per unit of exposure (tenths of a ms x gain).
+        # Try integration times shortest first; take the first with a gain that lands inside the
+        # band, preferring the one nearest the band's geometric middle.
+        target = self._target
+        for t in range(len(_INTEGRATION_TENTHS)):
+            full_scale = self._full_scale(t)
+            if full_scale < self.min_full_scale:
+                continue
+            best = None
+            best_error = 0
+            for g in range(len(_GAINS)):
+                predicted = brightness * self._exposure(t, g) / full_scale
+                if self._land_low <= predicted <= self._land_high:
+                    error = predicted / target if predicted > target else target / predicted
+                    if best is None or error < best_error:
+                        best = g
+                        best_error = error
+            if best is not None:
+                return t, best
+        if too_bright:
+            # Nothing lands in band: least exposure allowed
+            for t in range(len(_INTEGRATION_TENTHS)):
+                if self._full_scale(t) >= self.min_full_scale:
+                    return t, 0
+        # Too dark: most exposure
+        return len(_INTEGRATION_TENTHS) - 1, len(_GAINS) - 1
+
+    def update(self) -> bool:
+        """Check the latest sample and change exposure if the clear channel left the band.
+
+        Call once per loop or sensor period.
+
+        Returns:
+            True if the gain or integration time was changed
+        """
+        rgbc = self._read()
+        if rgbc is None or self._sample_count() < self._ready_at:
+            return False
+        exposure = self._exposure(self._time_index, self._gain_index)
+        self._last = rgbc
+        self._last_exposure = exposure
+
+        clear = rgbc[3]
+        full_scale = self._full_scale(self._time_index)
+        if self.low * full_scale <= clear <= self.high * full_scale:
+            return False
+
+        if clear >= full_scale:
+            # Saturated: the real level is unknown, so assume 4x brighter and converge from there
+            self.saturated += 1
+            brightness = 4 * full_scale / exposure
+        else:
+            brightness = max(clear, 1) / exposure
+
+        time_index, gain_index = self._choose(brightness, clear > self.high * full_scale)
+        if time_index == self._time_index and gain_index == self._gain_index:
+            return False
+
+        if gain_index != self._gain_index:
+            self.sensor.set_gain(_GAINS[gain_index])
+        if time_index != self._time_index:
+            self.sensor.set_integration_time(_INTEGRATION_MS[time_index])
+        self._time_index = time_index
+        self._gain_index = gain_index
+        self._ready_at = self._sample_count() + 2
+        self.changes += 1
+        return True
+
+    def normalized(self) -> tuple:
+        """Last sample seen by update(), scaled to the reference exposure.
+
+        Values are comparable across gain and integration-time changes.
+
+        Returns:
+            Tuple of (red, green, blue, clear) in counts at the reference exposure
+        """
+        exposure = self._last_exposure
+        reference = self._reference
+        r, g, b, c = self._last
+        return r * reference // exposure, g * reference // exposure, b * reference // exposure, c * reference // exposure
+
+    def settings(self) -> tuple:
+        """Returns:
+            Tuple of current (integration time in ms, gain)
+        """
+        return _INTEGRATION_MS[self._time_index], _GAINS[self._gain_index]
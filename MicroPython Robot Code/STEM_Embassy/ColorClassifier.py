@@ -0,0 +1,195 @@
+"""
+Nearest-centroid color classifier for the TCS34725 with profiles persisted to flash
+"""
+
+import time
+import ujson
+from array import array
+
+PROFILE_VERSION = 1
+
+# Features are scaled to 0..FEATURE_SCALE
+FEATURE_SCALE = 1024
+
+
+def chromaticity(r, g, b, c, brightness_half):
+    """Integer feature vector for one reading.
+
+    Red and green chromaticity don't change with illumination level, and the brightness term
+    tells white, grey and black apart.
+
+    Args:
+        r, g, b, c: Red, green, blue and clear counts
+        brightness_half: Clear count that maps to half-scale brightness
+
+    Returns:
+        Tuple of (red share, green share, brightness), each 0 to FEATURE_SCALE
+    """
+    total = r + g + b
+    if total == 0:
+        return 0, 0, 0
+    return (r * FEATURE_SCALE // total, g * FEATURE_SCALE // total,
+            c * FEATURE_SCALE // (c + brightness_half))
+
+
+class ColorClassifier:
+
+    def __init__(self, sensor, path: str = "color_profiles.json", brightness_half: int = 1024,
+                 brightness_weight: int = 1, max_distance: int = 120):
+        """Tell which of a set of calibrated colors is under the sensor.
+
+        Each color is stored as the centroid of its calibration samples in an integer
+        chromaticity space, and a reading goes to the nearest centroid. Profiles are saved to a
+        file on flash and loaded at startup, so calibration is only needed when the course or
+        lighting changes.
+
+        Args:
+            sensor: The TCS34725 to read; background sampling mode avoids blocking
+            path: Profile file on the robot's flash
+            brightness_half: Clear count that maps to half-scale brightness. Use exposure-normalized
+                counts (AutoExposure.normalized) when gain or integration time change at runtime
+            brightness_weight: Weight of brightness against chromaticity in the distance
+            max_distance: Readings farther than this from every centroid are reported as unknown
+        """
+        self.sensor = sensor
+        self.path = path
+        self.brightness_half = brightness_half
+        self.brightness_weight = brightness_weight
+        self.max_distance = max_distance
+
+        self.names = []
+        # Flat (red share, green share, brightness) per color, in the order of names
+        self._centroids = array('h')
+        self._max_sq = max_distance * max_distance
+
+        self.load()
+
+    def _read(self):
+        if self.sensor.is_sampling():
+            sample = self.sensor.latest()
+            return None if sample is None else sample[:4]
+        return self.sensor.read_rgbc()
+
+    def _features(self, rgbc):
+        r, g, b, c = rgbc
+        return chromaticity(r, g, b, c, self.brightness_half)
+
+    def calibrate(self, name: str, samples: int = 16):
+        """Capture a reference for a color. Hold the sensor over the color while this runs.
+
+        Args:
+            name: Name of the color; an existing color of that name is replaced
+            samples: Number of sensor samples to average
+
+        Returns:
+            The stored centroid
+        """
+        totals = [0, 0, 0]
+        seen = -1
+        taken = 0
+        while taken < samples:
+            if self.sensor.is_sampling():
+                # Wait for a fresh background sample rather than averaging the same one
+                if self.sensor.samples == seen:
+                    time.sleep_ms(1)
+                    continue
+                seen = self.sensor.samples
+            rgbc = self._read()
+            if rgbc is None:
+                continue
+            features = self._features(rgbc)
+            for i in range(3):
+                totals[i] += features[i]
+            taken += 1
+        centroid = (totals[0] // samples, totals[1] // samples, totals[2] // samples)
+        self._set(name, centroid)
+        return centroid
+
+    def _set(self, name, centroid):
+        if name in self.names:
+            i = self.names.index(name) * 3
+            for k in range(3):
+                self._centroids[i + k] = centroid[k]
+        else:
+            self.names.append(name)
+            self._centroids.extend(array('h', centroid))
+
+    def forget(self, name: str):
+        """Remove a calibrated color.
+
+        Args:
+            name: Name of the color to remove
+        """
+        i = self.names.index(name)
+        self.names.pop(i)
+        self._centroids = self._centroids[:i * 3] + self._centroids[i * 3 + 3:]
+
+    def classify(self, rgbc=None):
+        """Find the calibrated color nearest to a reading.
+
+        Args:
+            rgbc: (red, green, blue, clear) to classify; reads the sensor if not given
+
+        Returns:
+            Tuple of (name, confidence 0-100), or (None, 0) if nothing is calibrated or the
+            reading is farther than max_distance from every color
+        """
+        if rgbc is None:
+            rgbc = self._read()
+            if rgbc is None:
+                return None, 0
+        fr, fg, fb = self._features(rgbc)
+        weight = self.brightness_weight
+        centroids = self._centroids
+        best = second = -1
+        best_i = -1
+        for i in range(len(self.names)):
+            j = i * 3
+            dr = fr - centroids[j]
+            dg = fg - centroids[j + 1]
+            db = (fb - centroids[j + 2]) * weight
+            d = dr * dr + dg * dg + db * db
+            if best < 0 or d < best:
+                second = best
+                best = d
+                best_i = i
+            elif second < 0 or d < second:
+                second = d
+        if best_i < 0 or best > self._max_sq:
+            return None, 0
+        # Confidence falls as the reading moves from its centroid towards the runner-up,
+        # and towards max_distance when only one color is calibrated
+        limit = second if 0 <= second < self._max_sq else self._max_sq
+        if limit == 0:
+            return self.names[best_i], 0
+        return self.names[best_i], 100 - 100 * best // limit
+
+    def save(self):
+        """Write the calibrated colors to flash."""
+        profile = {
+            "version": PROFILE_VERSION,
+            "brightness_half": self.brightness_half,
+            "colors": {name: list(self._centroids[i * 3:i * 3 + 3]) for i, name in enumerate(self.names)},
+        }
+        with open(self.path, "w") as f:
+            ujson.dump(profile, f)
+
+    def load(self) -> bool:
+        """Replace the calibrated colors with the ones saved on flash.
+
+        Returns:
+            True if a compatible profile file was loaded
+        """
+        try:
+            with open(self.path) as f:
+                profile = ujson.load(f)
+        except (OSError, ValueError):
+            return False
+        if profile.get("version") != PROFILE_VERSION or profile.get("brightness_half") != self.brightness_half:
+            # Centroids from a different feature scaling would misclassify
+            return False
+        self.names = []
+        self._centroids = array('h')
+        for name, centroid in profile["colors"].items():
+            self._set(name, centroid)
+        return True
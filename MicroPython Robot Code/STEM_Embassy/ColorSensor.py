@@ -5,10 +5,16 @@ Based on Adafruit's TCS34725 driver
 
 import time
 import ustruct
-from machine import Pin, I2C
+from array import array
+from machine import Pin, I2C, Timer, disable_irq, enable_irq
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
 
 # TCS34725 Command Register
 _COMMAND_BIT = const(0x80)
+_COMMAND_AUTO_INCREMENT = const(0x20)  # Register address advances on each byte
 
 # TCS34725 Registers
 _REGISTER_ENABLE = const(0x00)
@@ -48,9 +54,146 @@ _GAIN_4X = const(0x01)
 _GAIN_16X = const(0x02)
 _GAIN_60X = const(0x03)
 
+# STATUS followed by CDATAL/H, RDATAL/H, GDATAL/H, BDATAL/H
+_RGBC_BURST_SIZE = const(9)
+
 _GAINS = (1, 4, 16, 60)
 _CYCLES = (0, 1, 2, 3, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60)
 
+# Where the clear channel is relative to the band given to start_events()
+BAND_BELOW = const(-1)
+BAND_INSIDE = const(0)
+BAND_ABOVE = const(1)
+
+# RGB to CIE XYZ coefficients in Q10 fixed point (x1024)
+_X_R = const(-146)
+_X_G = const(1586)
+_X_B = const(-979)
+_Y_R = const(-332)
+_Y_G = const(1616)
+_Y_B = const(-749)
+_Z_R = const(-698)
+_Z_G = const(789)
+_Z_B = const(577)
+# McCamy's epicentre (0.3320, 0.1858) and the constant term 5520.33 in Q10
+_XE_Q10 = const(340)
+_YE_Q10 = const(190)
+_CCT_C0_Q10 = const(5652818)
+# |n| is clamped to 2.0 in Q10, past the useful range of the fit, so every
+# intermediate stays a small int
+_N_LIMIT_Q10 = const(2048)
+
+
+class ColorSample:
+    """One RGBC reading, with derived values computed on first use and then reused.
+
+    Everything is integer math: no float temporaries on the heap.
+    """
+
+    def __init__(self, red, green, blue, clear, integration_tenths, gain, ticks_ms=None):
+        """Create a sample.
+
+        Args:
+            red, green, blue, clear: Raw channel counts
+            integration_tenths: Integration time of the reading in tenths of a ms
+            gain: Gain of the reading
+            ticks_ms: When the reading was taken, if known
+        """
+        self.red = red
+        self.green = green
+        self.blue = blue
+        self.clear = clear
+        self.integration_tenths = integration_tenths
+        self.gain = gain
+        self.ticks_ms = ticks_ms
+        self._normalized = None
+        self._cct = None
+        self._lux = None
+
+    def rgbc(self):
+        """Returns:
+            Tuple of (red, green, blue, clear) counts
+        """
+        return self.red, self.green, self.blue, self.clear
+
+    def rgb_normalized(self):
+        """Returns:
+            Tuple of (red, green, blue) values in 0-255 range, relative to clear
+        """
+        if self._normalized is None:
+            c = self.clear
+            if c == 0:
+                self._normalized = (0, 0, 0)
+            else:
+                self._normalized = (self.red * 255 // c, self.green * 255 // c, self.blue * 255 // c)
+        return self._normalized
+
+    def rgb_hex(self):
+        """Returns:
+            Hex color string (e.g. "FF0000" for red)
+        """
+        r, g, b = self.rgb_normalized()
+        return f"{r:02x}{g:02x}{b:02x}"
+
+    def color_temperature(self):
+        """Returns:
+            Correlated color temperature in kelvin (McCamy's approximation), 0 if not measurable
+        """
+        if self._cct is None:
+            self._compute_xyz()
+        return self._cct
+
+    def lux(self):
+        """Returns:
+            Illuminance in whole lux
+        """
+        if self._lux is None:
+            self._compute_xyz()
+        return self._lux
+
+    def _compute_xyz(self):
+        r, g, b = self.red, self.green, self.blue
+        if self.clear == 0:
+            self._cct = self._lux = 0
+            return
+
+        # Q10 values; at most ~2^28 for 16-bit counts
+        x = _X_R * r + _X_G * g + _X_B * b
+        y = _Y_R * r + _Y_G * g + _Y_B * b
+        z = _Z_R * r + _Z_G * g + _Z_B * b
+
+        self._lux = max(0, (y >> 10) * 240 // (self.integration_tenths * self.gain))
+
+        s = x + y + z
+        if s <= 0:
+            self._cct = 0
+            return
+        # Bring the sum into [2^14, 2^15) so the ratios below keep ~0.1% precision
+        # without leaving small-int range
+        while s >= 0x8000:
+            x >>= 1
+            y >>= 1
+            s >>= 1
+        while s < 0x4000:
+            x <<= 1
+            y <<= 1
+            s <<= 1
+
+        # n = (xc - 0.3320) / (0.1858 - yc), with xc = x/s and yc = y/s, in Q10
+        den = (_YE_Q10 * s - (y << 10)) >> 10
+        if den == 0:
+            self._cct = 0
+            return
+        n = ((x << 10) - _XE_Q10 * s) // den
+        if n > _N_LIMIT_Q10:
+            n = _N_LIMIT_Q10
+        elif n < -_N_LIMIT_Q10:
+            n = -_N_LIMIT_Q10
+        n2 = (n * n) >> 10
+        n3 = (n2 * n) >> 10
+        # 449 n^3 + 3525 n^2 + 6823.3 n + 5520.33
+        self._cct = max(0, (449 * n3 + 3525 * n2 + 6823 * n + n * 3 // 10 + _CCT_C0_Q10) >> 10)
+
 
 class TCS34725:
     """Driver for the TCS34725 color sensor."""
@@ -69,6 +212,29 @@ class TCS34725:
             
         self.address = address
         self._active = False
+        self._rgbc_buf = bytearray(_RGBC_BURST_SIZE)
+        
+        # Background sampling state, see start_sampling()
+        self._sampling = False
+        self._timer = None
+        self._int_pin = None
+        self._ring_ticks = None
+        self._ring_rgbc = None
+        self._ring_size = 0
+        self._ring_next = 0
+        self._ring_count = 0
+        self.samples = 0
+        
+        # Threshold event state, see start_events()
+        self._limits_buf = bytearray(4)
+        self._event_pin = None
+        self._event_callback = None
+        self._event_flag = None
+        self._band_low = 0
+        self._band_high = 0xFFFF
+        self.band_state = BAND_INSIDE
+        self.band_clear = 0
+        self.band_events = 0
         
         # Check sensor ID
         sensor_id = self.sensor_id()
@@ -141,8 +307,14 @@ class TCS34725:
         else:
             atime = _INTEGRATION_TIME_700MS
             self._integration_time = 700
+        self._integration_tenths = int(self._integration_time * 10)
             
         self._write_register(_REGISTER_ATIME, atime)
+        
+        if self._timer is not None:
+            # Keep timer-driven sampling in step with the new cycle length
+            self._timer.init(period=int(self._integration_time) + 1, mode=Timer.PERIODIC,
+                             callback=lambda t: self._sample_if_ready())
 
     def set_gain(self, gain):
         """Set sensor gain.
@@ -157,6 +329,30 @@ class TCS34725:
         self._write_register(_REGISTER_CONTROL, control)
         self._gain = gain
 
+    def get_integration_time(self):
+        """Returns:
+            Current integration time in milliseconds (2.4, 24, 101, 154, or 700)
+        """
+        return self._integration_time
+
+    def get_gain(self):
+        """Returns:
+            Current gain (1, 4, 16, or 60)
+        """
+        return self._gain
+
+    def _read_rgbc_burst(self):
+        """Read STATUS and all four channels in one auto-increment transaction.
+
+        The channels come from the same integration cycle, and nothing is allocated.
+
+        Returns:
+            True if AVALID was set, with the data left in self._rgbc_buf
+        """
+        self.i2c.readfrom_mem_into(self.address, _REGISTER_STATUS | _COMMAND_BIT | _COMMAND_AUTO_INCREMENT,
+                                   self._rgbc_buf)
+        return bool(self._rgbc_buf[0] & _AVALID)
+
     def _data_ready(self):
         """Check if RGBC data is ready."""
         status = self._read_register(_REGISTER_STATUS)
@@ -168,27 +364,160 @@ class TCS34725:
         Returns:
             Tuple of (red, green, blue, clear) values
         """
+        if self._sampling and self._ring_count:
+            return self.latest()[:4]
+        
         if not self._active:
             self.active(True)
         
-        # Wait for data to be ready
-        while not self._data_ready():
+        # Wait for data to be ready; the status poll and the data read are one transaction
+        while not self._read_rgbc_burst():
             time.sleep_ms(int(self._integration_time) + 1)
         
-        clear = self._read_word(_REGISTER_CDATAL)
-        red = self._read_word(_REGISTER_RDATAL)
-        green = self._read_word(_REGISTER_GDATAL)
-        blue = self._read_word(_REGISTER_BDATAL)
+        clear, red, green, blue = ustruct.unpack_from('<HHHH', self._rgbc_buf, 1)
         
         return red, green, blue, clear
 
+    def start_sampling(self, history=32, int_pin=None):
+        """Sample every integration cycle in the background into a ring buffer.
+        
+        Each sample is one burst read stored with its ticks_ms timestamp, so
+        latest() and history() never block or touch the bus. While sampling,
+        read_rgbc() also returns the latest sample instead of waiting.
+        
+        Args:
+            history: Number of samples kept (at least 2)
+            int_pin: Pin wired to the sensor's INT output. If given, the AVALID
+                interrupt triggers each read; otherwise a virtual timer polls
+                once per integration time.
+        """
+        if history < 2:
+            raise ValueError("history must be at least 2")
+        self.stop_sampling()
+        if not self._active:
+            self.active(True)
+        
+        self._ring_ticks = array('I', bytes(4 * history))
+        self._ring_rgbc = array('H', bytes(8 * history))
+        self._ring_size = history
+        self._ring_next = 0
+        self._ring_count = 0
+        self.samples = 0
+        self._sampling = True
+        
+        if int_pin is None:
+            # A timer ID of -1 is a virtual timer.
+            # Leaves the hardware timers for more important uses
+            self._timer = Timer(-1)
+            self._timer.init(period=int(self._integration_time) + 1, mode=Timer.PERIODIC,
+                             callback=lambda t: self._sample_if_ready())
+        else:
+            # INT is open drain and goes low at the end of every cycle with persistence 0
+            self.stop_events()
+            self._int_pin = Pin(int_pin, Pin.IN, Pin.PULL_UP)
+            self.set_interrupt(True, persistence=0)
+            self.clear_interrupt()
+            self._int_pin.irq(trigger=Pin.IRQ_FALLING, handler=lambda p: self._sample_on_interrupt())
+
+    def stop_sampling(self):
+        """Stop background sampling. The ring buffer keeps its samples."""
+        if self._timer is not None:
+            self._timer.deinit()
+            self._timer = None
+        if self._int_pin is not None:
+            self._int_pin.irq(handler=None)
+            self._int_pin = None
+            self.set_interrupt(False)
+            self.clear_interrupt()
+        self._sampling = False
+
+    def is_sampling(self):
+        """Check whether background sampling is running."""
+        return self._sampling
+
+    def _sample_if_ready(self):
+        if self._read_rgbc_burst():
+            self._push_sample()
+
+    def _sample_on_interrupt(self):
+        self._read_rgbc_burst()
+        self._push_sample()
+        self.clear_interrupt()
+
+    def _push_sample(self):
+        # Runs in a callback, so only small ints and preallocated arrays are touched
+        i = self._ring_next
+        buf = self._rgbc_buf
+        rgbc = self._ring_rgbc
+        j = i * 4
+        rgbc[j] = buf[3] | (buf[4] << 8)       # red
+        rgbc[j + 1] = buf[5] | (buf[6] << 8)   # green
+        rgbc[j + 2] = buf[7] | (buf[8] << 8)   # blue
+        rgbc[j + 3] = buf[1] | (buf[2] << 8)   # clear
+        self._ring_ticks[i] = time.ticks_ms()
+        i += 1
+        self._ring_next = 0 if i == self._ring_size else i
+        if self._ring_count < self._ring_size:
+            self._ring_count += 1
+        self.samples += 1
+
+    def _ring_entry(self, i):
+        j = i * 4
+        rgbc = self._ring_rgbc
+        return rgbc[j], rgbc[j + 1], rgbc[j + 2], rgbc[j + 3], self._ring_ticks[i]
+
+    def latest(self):
+        """Most recent background sample, without blocking.
+        
+        Returns:
+            Tuple of (red, green, blue, clear, ticks_ms), or None if there is no sample yet
+        """
+        state = disable_irq()
+        count = self._ring_count
+        sample = self._ring_entry((self._ring_next - 1) % self._ring_size) if count else None
+        enable_irq(state)
+        return sample
+
+    def history(self, count=None):
+        """Buffered background samples, oldest first, without blocking.
+        
+        Args:
+            count: Number of most recent samples to return (default all buffered)
+            
+        Returns:
+            List of (red, green, blue, clear, ticks_ms) tuples
+        """
+        state = disable_irq()
+        available = self._ring_count
+        if count is None or count > available:
+            count = available
+        start = self._ring_next - count
+        samples = [self._ring_entry((start + k) % self._ring_size) for k in range(count)]
+        enable_irq(state)
+        return samples
+
+    def read_sample(self):
+        """Take one reading to derive several values from.
+        
+        Returns:
+            ColorSample; ask it for rgb_normalized(), rgb_hex(), color_temperature(),
+            lux() in any combination without reading the sensor again
+        """
+        if self._sampling and self._ring_count:
+            r, g, b, c, ticks = self.latest()
+            return ColorSample(r, g, b, c, self._integration_tenths, self._gain, ticks)
+        r, g, b, c = self.read_rgbc()
+        return ColorSample(r, g, b, c, self._integration_tenths, self._gain, time.ticks_ms())
+
     def read_color_temperature(self):
         """Calculate color temperature and lux from RGBC data.
         
         Returns:
-            Tuple of (color_temperature, lux)
+            Tuple of (color_temperature, lux) as floats; read_sample() gives the
+            integer versions without float math
         """
-        r, g, b, c = self.read_rgbc()
+        sample = self.read_sample()
+        r, g, b, c = sample.rgbc()
         
         if c == 0:
             return 0, 0
@@ -207,7 +536,7 @@ class TCS34725:
         cct = 449.0 * n**3 + 3525.0 * n**2 + 6823.3 * n + 5520.33
         
         # Lux calculation
-        lux = y / (self._integration_time * self._gain / 24.0)
+        lux = y / (sample.integration_tenths * sample.gain / 240.0)
         
         return cct, lux
 
@@ -217,16 +546,7 @@ class TCS34725:
         Returns:
             Tuple of (red, green, blue) values in 0-255 range
         """
-        r, g, b, c = self.read_rgbc()
-        
-        if c == 0:
-            return 0, 0, 0
-        
-        red = int((r / c) * 255)
-        green = int((g / c) * 255)
-        blue = int((b / c) * 255)
-        
-        return red, green, blue
+        return self.read_sample().rgb_normalized()
 
     def read_rgb_hex(self):
         """Read RGB color as hex string.
@@ -234,8 +554,7 @@ class TCS34725:
         Returns:
             Hex color string (e.g. "FF0000" for red)
         """
-        r, g, b = self.read_rgb_normalized()
-        return f"{r:02x}{g:02x}{b:02x}"
+        return self.read_sample().rgb_hex()
 
     def set_interrupt(self, enabled=True, persistence=0):
         """Enable or disable interrupt.
@@ -262,15 +581,115 @@ class TCS34725:
             low: Low threshold (16-bit)
             high: High threshold (16-bit)
         """
-        self.i2c.writeto_mem(self.address, _REGISTER_AILT | _COMMAND_BIT, ustruct.pack('<H', low))
-        self.i2c.writeto_mem(self.address, _REGISTER_AIHT | _COMMAND_BIT, ustruct.pack('<H', high))
+        # AILTL..AIHTH are consecutive, so both limits go in one transaction
+        ustruct.pack_into('<HH', self._limits_buf, 0, low, high)
+        self.i2c.writeto_mem(self.address, _REGISTER_AILT | _COMMAND_BIT | _COMMAND_AUTO_INCREMENT,
+                             self._limits_buf)
 
     def clear_interrupt(self):
         """Clear interrupt flag."""
         self.i2c.writeto(self.address, b'\xE6')
 
+    def start_events(self, int_pin, low, high, persistence=2, callback=None):
+        """Report the clear channel entering or leaving a band, driven by the INT pin.
+        
+        The sensor compares every cycle against its threshold registers and only pulls
+        INT low once the reading has been outside them for `persistence` cycles. The
+        handler then does one read, re-arms the thresholds around the new state, and
+        reports the change. Nothing crosses the bus while the state holds.
+        
+        Args:
+            int_pin: Pin wired to the sensor's INT output
+            low: Clear count below which the reading is BAND_BELOW
+            high: Clear count above which the reading is BAND_ABOVE
+            persistence: Consecutive out-of-threshold cycles before an event (1-60)
+            callback: Called as callback(state, clear) on every change of band_state.
+                Runs in the pin's interrupt callback, so it should be short.
+        """
+        if persistence == 0:
+            raise ValueError("Persistence 0 interrupts on every cycle; use start_sampling instead")
+        if self._int_pin is not None:
+            # Both modes need the INT pin
+            self.stop_sampling()
+        self.stop_events()
+        if not self._active:
+            self.active(True)
+        
+        self._band_low = low
+        self._band_high = high
+        self._event_callback = callback
+        
+        r, g, b, c = self.read_rgbc()
+        self.band_state = self._band_of(c)
+        self.band_clear = c
+        self._arm_band(self.band_state)
+        self.set_interrupt(True, persistence)
+        self.clear_interrupt()
+        
+        # INT is open drain and active low
+        self._event_pin = Pin(int_pin, Pin.IN, Pin.PULL_UP)
+        self._event_pin.irq(trigger=Pin.IRQ_FALLING, handler=lambda p: self._on_threshold())
+
+    def stop_events(self):
+        """Stop threshold events."""
+        if self._event_pin is None:
+            return
+        self._event_pin.irq(handler=None)
+        self._event_pin = None
+        self.set_interrupt(False)
+        self.clear_interrupt()
+
+    def _band_of(self, clear):
+        if clear < self._band_low:
+            return BAND_BELOW
+        if clear > self._band_high:
+            return BAND_ABOVE
+        return BAND_INSIDE
+
+    def _arm_band(self, state):
+        # The sensor interrupts outside [AILT, AIHT], so arm the window that
+        # contains the current state and fire on leaving it
+        if state == BAND_BELOW:
+            self.set_interrupt_limits(0, self._band_low)
+        elif state == BAND_ABOVE:
+            self.set_interrupt_limits(self._band_high, 0xFFFF)
+        else:
+            self.set_interrupt_limits(self._band_low, self._band_high)
+
+    def _on_threshold(self):
+        self._read_rgbc_burst()
+        buf = self._rgbc_buf
+        clear = buf[1] | (buf[2] << 8)
+        state = self._band_of(clear)
+        self._arm_band(state)
+        self.clear_interrupt()
+        if state == self.band_state:
+            return
+        self.band_state = state
+        self.band_clear = clear
+        self.band_events += 1
+        if self._event_callback is not None:
+            self._event_callback(state, clear)
+        if self._event_flag is not None:
+            self._event_flag.set()
+
+    async def wait_event(self):
+        """Wait for the next band change.
+        
+        Returns:
+            Tuple of (state, clear): BAND_BELOW, BAND_INSIDE or BAND_ABOVE and the
+            clear count that triggered it
+        """
+        if self._event_flag is None:
+            # Safe to set from an interrupt handler, unlike asyncio.Event
+            self._event_flag = asyncio.ThreadSafeFlag()
+        await self._event_flag.wait()
+        return self.band_state, self.band_clear
+
     def __del__(self):
         """Cleanup when object is deleted."""
+        self.stop_sampling()
+        self.stop_events()
         self.active(False)
 
 
@@ -288,17 +707,12 @@ if __name__ == "__main__":
         r, g, b, c = sensor.read_rgbc()
         print(f"Red: {r}, Green: {g}, Blue: {b}, Clear: {c}")
         
-        # Read color temperature and lux
-        temp, lux = sensor.read_color_temperature()
-        print(f"Color Temp: {temp:.0f}K, Lux: {lux:.2f}")
-        
-        # Read normalized RGB values
-        r_norm, g_norm, b_norm = sensor.read_rgb_normalized()
+        # Derive color temperature, lux, normalized RGB and hex from one reading
+        sample = sensor.read_sample()
+        print(f"Color Temp: {sample.color_temperature()}K, Lux: {sample.lux()}")
+        r_norm, g_norm, b_norm = sample.rgb_normalized()
         print(f"RGB (0-255): {r_norm}, {g_norm}, {b_norm}")
-        
-        # Read hex color
-        hex_color = sensor.read_rgb_hex()
-        print(f"Hex color: #{hex_color}")
+        print(f"Hex color: #{sample.rgb_hex()}")
         
         print("-" * 30)
         time.sleep(1)
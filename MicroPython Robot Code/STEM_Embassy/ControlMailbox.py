@@ -0,0 +1,153 @@
+"""
+Latest-state mailbox for teleop control messages
+"""
+
+import ujson
+
+from ControlProtocol import is_control_message, decode_control
+
+
+class ControlMailbox:
+    """Coalesces incoming control messages into one latest control state.
+
+    Key and servo fields are absolute states, so when several messages arrive
+    between robot ticks only the newest value of each field matters. Messages
+    are merged on arrival and the robot takes the merged state once per tick.
+    """
+
+    def __init__(self, servo=90):
+        """Create an empty mailbox with all keys released.
+
+        Args:
+            servo: Servo angle in the state until a message sets one
+        """
+        # Latest merged control state
+        self.state = {"w": False, "a": False, "s": False, "d": False, "servo": servo,
+                      "straight": 0, "turn": 0, "seq": 0}
+        self._fresh = False
+
+        # Counters
+        self.received = 0   # messages accepted into the mailbox
+        self.merged = 0     # messages superseded by a newer one before being taken
+        self.dropped = 0    # messages that could not be decoded
+        self.taken = 0      # states handed to the robot
+        self.max_batch = 0  # most messages coalesced into a single take()
+        self._batch = 0
+
+    def post(self, data):
+        """Merge a decoded control message (dict) into the latest state.
+
+        Only the control fields already in the state are taken; anything else
+        in the message is ignored, so a client can't grow the state dict.
+
+        Args:
+            data: Decoded control message
+        """
+        state = self.state
+        for key in data:
+            if key in state:
+                state[key] = data[key]
+        self._count_post()
+
+    def _count_post(self):
+        self.received += 1
+        if self._fresh:
+            self.merged += 1
+        self._fresh = True
+        self._batch += 1
+
+    def post_message(self, message):
+        """Decode a message and merge it.
+
+        Text (str) messages are JSON. Binary messages are control frames; the
+        WebSocket client only delivers them when the binary subprotocol was
+        negotiated, so they are never parsed as JSON.
+
+        Args:
+            message: Text or binary message from the WebSocket client
+
+        Returns:
+            False if the message was dropped, otherwise True
+        """
+        if not isinstance(message, str):
+            if not is_control_message(message):
+                self.dropped += 1
+                return False
+            # Binary control frame; decoded straight into the state dict
+            decode_control(message, self.state)
+            self._count_post()
+            return True
+        try:
+            data = ujson.loads(message)
+        except ValueError:
+            self.dropped += 1
+            return False
+        if not isinstance(data, dict):
+            self.dropped += 1
+            return False
+        self.post(data)
+        return True
+
+    def drain(self, ws, timeout=0):
+        """Read every pending message from a WebSocketClient into the mailbox.
+
+        Waits up to timeout seconds for the first read, then keeps reading
+        without waiting until the socket has nothing more.
+
+        Args:
+            ws: The WebSocketClient to read from
+            timeout: Seconds to wait for the first read
+
+        Returns:
+            False if the connection failed, otherwise True
+        """
+        while True:
+            got_any = False
+            for message in ws.receive_messages(timeout):
+                if message is False:
+                    return False
+                got_any = True
+                self.post_message(message)
+            if not got_any:
+                return True
+            timeout = 0
+
+    def reset(self):
+        """Release all keys and discard any state that hasn't been taken yet."""
+        self.state["w"] = self.state["a"] = self.state["s"] = self.state["d"] = False
+        self.state["straight"] = self.state["turn"] = 0
+        self._fresh = False
+        self._batch = 0
+
+    def pending(self):
+        """Returns:
+            True if a state newer than the last take() is waiting
+        """
+        return self._fresh
+
+    def take(self):
+        """Hand the latest state to the robot.
+
+        Returns:
+            The merged state dict if it changed since the last call, otherwise None
+        """
+        if not self._fresh:
+            return None
+        self._fresh = False
+        self.taken += 1
+        if self._batch > self.max_batch:
+            self.max_batch = self._batch
+        self._batch = 0
+        return self.state
+
+    def stats(self):
+        """Returns:
+            Dict of the counters (received, merged, dropped, taken, max_batch)
+        """
+        return {
+            "received": self.received,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "taken": self.taken,
+            "max_batch": self.max_batch,
+        }
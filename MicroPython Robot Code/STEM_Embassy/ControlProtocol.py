@@ -0,0 +1,59 @@
+"""
+Compact binary teleop control message (WebSocket opcode 0x2)
+
+Layout, little endian, CONTROL_SIZE bytes:
+    uint8   magic     CONTROL_MAGIC, distinguishes binary frames from JSON
+    uint8   keys      bitfield of KEY_W | KEY_A | KEY_S | KEY_D
+    uint16  servo     servo angle in hundredths of a degree
+    int16   straight  joystick forward effort, Q15 (-32767..32767 = -1..1)
+    int16   turn      joystick turn effort, Q15
+    uint16  seq       sender's message counter, wraps
+"""
+
+import ustruct
+
+# Subprotocol names offered in the handshake; the server picks one
+PROTOCOL_BINARY = "tse.control.v1"
+PROTOCOL_JSON = "tse.json"
+
+CONTROL_FORMAT = "<BBHhhH"
+CONTROL_SIZE = 10
+CONTROL_MAGIC = 0xB1
+
+KEY_W = 0x01
+KEY_A = 0x02
+KEY_S = 0x04
+KEY_D = 0x08
+
+_Q15 = 32767
+
+
+def is_control_message(payload):
+    """Whether payload looks like a binary control message."""
+    return len(payload) == CONTROL_SIZE and payload[0] == CONTROL_MAGIC
+
+
+def decode_control(payload, state):
+    """Decode a binary control message into an existing state dict, in place.
+
+    Fills the same keys as the JSON messages ("w", "a", "s", "d", "servo")
+    plus "straight", "turn" and "seq".
+    """
+    _, keys, servo, straight, turn, seq = ustruct.unpack_from(CONTROL_FORMAT, payload)
+    state["w"] = bool(keys & KEY_W)
+    state["a"] = bool(keys & KEY_A)
+    state["s"] = bool(keys & KEY_S)
+    state["d"] = bool(keys & KEY_D)
+    state["servo"] = servo / 100
+    state["straight"] = straight / _Q15
+    state["turn"] = turn / _Q15
+    state["seq"] = seq
+    return state
+
+
+def encode_control(buf, w=False, a=False, s=False, d=False, servo=90, straight=0, turn=0, seq=0):
+    """Pack a binary control message into buf (at least CONTROL_SIZE bytes)."""
+    keys = (KEY_W if w else 0) | (KEY_A if a else 0) | (KEY_S if s else 0) | (KEY_D if d else 0)
+    ustruct.pack_into(CONTROL_FORMAT, buf, 0, CONTROL_MAGIC, keys, int(servo * 100),
+                      int(straight * _Q15), int(turn * _Q15), seq & 0xFFFF)
+    return CONTROL_SIZE
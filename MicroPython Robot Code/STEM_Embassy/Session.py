@@ -0,0 +1,104 @@
+"""
+Reconnecting WebSocket session for the teleop client
+
+Keeps WiFi and an AsyncWebSocketClient up without rebooting the board: a
+dropped link (socket error, close frame or missed pong) leads to a safe stop
+and a reconnect with jittered exponential backoff.
+"""
+
+import random
+import time
+import network
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+
+class ReconnectingSession:
+
+    def __init__(self, ws, ssid, password, safe_stop=None, min_backoff_ms: int = 250,
+                 max_backoff_ms: int = 8000, wifi_timeout_s: int = 30):
+        """Keep WiFi and a WebSocket connection up, reconnecting with backoff.
+
+        Args:
+            ws: The AsyncWebSocketClient to keep connected
+            ssid: WiFi network name
+            password: WiFi password
+            safe_stop: Called with no arguments whenever the link drops, to stop the robot
+            min_backoff_ms: Delay before the first reconnect attempt
+            max_backoff_ms: Upper bound on the delay between attempts
+            wifi_timeout_s: How long to wait for WiFi association per attempt
+        """
+        self.ws = ws
+        self.ssid = ssid
+        self.password = password
+        self.safe_stop = safe_stop
+        self.min_backoff_ms = min_backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.wifi_timeout_s = wifi_timeout_s
+        self.wlan = network.WLAN(network.STA_IF)
+
+        self._backoff_ms = min_backoff_ms
+
+        # Counters
+        self.connects = 0
+        self.disconnects = 0
+        self.failed_attempts = 0
+        self.last_outage_ms = 0
+
+    async def connect_wifi(self):
+        """Associate with the WiFi network if not already connected.
+
+        Returns:
+            True if WiFi is connected
+        """
+        if self.wlan.isconnected():
+            return True
+        print("* Waiting for WiFi connection...")
+        self.wlan.active(True)
+        self.wlan.disconnect()
+        self.wlan.connect(self.ssid, self.password)
+        for _ in range(self.wifi_timeout_s * 10):
+            if self.wlan.isconnected():
+                print(f"* Wifi Connected! IP Address: {self.wlan.ifconfig()[0]}")
+                return True
+            await asyncio.sleep_ms(100)
+        print("* WiFi connection failed!")
+        return False
+
+    def _next_backoff_ms(self):
+        # Wait somewhere between half and all of the current backoff, then double it
+        delay = self._backoff_ms // 2 + (self._backoff_ms // 2) * random.getrandbits(8) // 255
+        self._backoff_ms = min(self._backoff_ms * 2, self.max_backoff_ms)
+        return delay
+
+    def _stop(self):
+        if self.safe_stop is not None:
+            self.safe_stop()
+
+    async def run(self, on_connected):
+        """Keep the session alive forever.
+
+        Args:
+            on_connected: Coroutine function called after every successful connect.
+                It should return once the connection is lost (e.g. when ``async for`` over ws ends).
+        """
+        down_since = time.ticks_ms()
+        while True:
+            if await self.connect_wifi() and await self.ws.connect():
+                self.connects += 1
+                self.last_outage_ms = time.ticks_diff(time.ticks_ms(), down_since)
+                self._backoff_ms = self.min_backoff_ms
+                try:
+                    await on_connected()
+                finally:
+                    self.ws.close()
+                    self._stop()
+                self.disconnects += 1
+                down_since = time.ticks_ms()
+                print("* Connection lost, reconnecting")
+            else:
+                self.failed_attempts += 1
+                self._stop()
+            await asyncio.sleep_ms(self._next_backoff_ms())
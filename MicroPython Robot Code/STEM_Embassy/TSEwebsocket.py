@@ -2,42 +2,114 @@ import socket
 import struct
 import os
 import time
-import ujson
+
+from ControlMailbox import ControlMailbox
+from ControlProtocol import PROTOCOL_BINARY, PROTOCOL_JSON
+
+# Frame header is written right-aligned into the first TX_HEADROOM bytes of the
+# transmit buffer so the payload always starts on a word boundary
+TX_HEADROOM = 16
+TX_BUFFER_SIZE = 512
+
+# Masking keys are drawn from a pool of os.urandom bytes, refilled every
+# MASK_POOL_SIZE // 4 frames
+MASK_POOL_SIZE = 256
+
+# Receive buffer size, and the largest message it may grow to hold
+RX_BUFFER_SIZE = 1024
+RX_MAX_MESSAGE = 16384
+
+# errno values / messages that mean "no data yet" rather than a dead socket
+_TIMEOUT_ERRORS = (11, 110, "timed out")
+
+
+try:
+    import micropython
+
+    @micropython.viper
+    def _xor_mask(buf, offset: int, length: int, mask):
+        # XOR a word at a time when offset is word aligned, bytewise otherwise
+        p8 = ptr8(buf)
+        m = ptr8(mask)
+        i = offset
+        end = offset + length
+        if (offset & 3) == 0:
+            p32 = ptr32(buf)
+            key = int(m[0]) | (int(m[1]) << 8) | (int(m[2]) << 16) | (int(m[3]) << 24)
+            w = offset >> 2
+            w_end = w + (length >> 2)
+            while w < w_end:
+                p32[w] = p32[w] ^ key
+                w += 1
+            i = w << 2
+        k = 0
+        while i < end:
+            p8[i] = p8[i] ^ m[k & 3]
+            k += 1
+            i += 1
+except (ImportError, AttributeError, NameError):
+    # Host fallback (CPython), same in-place semantics
+    def _xor_mask(buf, offset, length, mask):
+        for i in range(length):
+            buf[offset + i] ^= mask[i & 3]
 
 
 class WebSocketClient:
-    def __init__(self, host, port, path):
+    def __init__(self, host, port, path, binary=True):
         self.wsHost = host
         self.wsPort = port
         self.wsPath = path
-        self.ws = socket.socket()
+        self.ws = None
+        # Control encodings offered at connect, most preferred first. The
+        # server's choice ends up in self.protocol; JSON if it didn't pick one.
+        self.protocols = (PROTOCOL_BINARY, PROTOCOL_JSON) if binary else (PROTOCOL_JSON,)
+        self.protocol = PROTOCOL_JSON
         self.ping_interval = 30  # seconds
         self.pong_timeout = 10   # seconds
         self.last_ping_sent = 0
         self.last_pong_received = 0
+
+        # Reusable transmit buffer and masking key, so sending doesn't allocate
+        self._tx_buf = bytearray(TX_HEADROOM + TX_BUFFER_SIZE)
+        self._tx_mv = memoryview(self._tx_buf)
+        self._mask_key = bytearray(4)
+        self._mask_pool = bytearray(MASK_POOL_SIZE)
+        self._mask_pos = MASK_POOL_SIZE  # empty; filled on first use
+        # Larger data messages are fragmented into frames of at most this size
+        self.max_frame_payload = TX_BUFFER_SIZE
+
+        # Persistent receive buffer; unread bytes live in [_rx_start, _rx_end)
+        self._rx_buf = bytearray(RX_BUFFER_SIZE)
+        self._rx_mv = memoryview(self._rx_buf)
+        self._rx_start = 0
+        self._rx_end = 0
+        # Opcode and payload of a fragmented message being reassembled
+        self._frag_opcode = None
+        self._frag_buf = None
+        # Binary messages dropped because the binary subprotocol wasn't negotiated
+        self.rejected = 0
+
+        # Latest-state mailbox used by handle_websocket
+        self.mailbox = ControlMailbox()
         
     def connect(self):
         """Establish WebSocket connection with handshake."""
+        if self.ws is not None:
+            self.close()
+        self.ws = socket.socket()
         self.ws.settimeout(5)
         
         try:
             addr = socket.getaddrinfo(self.wsHost, self.wsPort)[0][-1]
             self.ws.connect(addr)
+            self._set_nodelay(self.ws)
+            self._send_all(self._handshake_request())
 
-            handshake = (
-                "GET {path} HTTP/1.1\r\n"
-                "Host: {host}:{port}\r\n"
-                "Upgrade: websocket\r\n"
-                "Connection: Upgrade\r\n"
-                "Sec-WebSocket-Key: x3JJHMbDL1EzLkh9GBhXDw==\r\n"
-                "Sec-WebSocket-Version: 13\r\n\r\n"
-            ).format(path=self.wsPath, host=self.wsHost, port=self.wsPort)
-            self.ws.send(handshake)
-
-            # read response
-            response = self.ws.recv(1024)
-            if b"101 Switching Protocols" not in response:
-                raise Exception("websocket handshake failed")
+            # read response into the receive buffer
+            self._reset_rx()
+            while not self._handshake_response_complete():
+                if not self._fill():
+                    raise Exception("websocket handshake failed")
             
             print("* WS connected!")
             return True
@@ -46,110 +118,358 @@ class WebSocketClient:
             return False
 
     def close(self):
-        self.ws.close()
+        if self.ws is not None:
+            self.ws.close()
+            self.ws = None
+
+    def _set_nodelay(self, sock):
+        """Disable Nagle so small control/ack frames go out immediately, where supported."""
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (AttributeError, OSError):
+            pass
+
+    def _handshake_request(self):
+        return (
+            "GET {path} HTTP/1.1\r\n"
+            "Host: {host}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            "Sec-WebSocket-Key: x3JJHMbDL1EzLkh9GBhXDw==\r\n"
+            "Sec-WebSocket-Protocol: {protocols}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        ).format(path=self.wsPath, host=self.wsHost, port=self.wsPort,
+                 protocols=", ".join(self.protocols)).encode()
+
+    def _handshake_response_complete(self):
+        """Check the receive buffer for the full HTTP upgrade response.
+
+        Anything after the blank line is already frame data and is left in
+        the buffer for receive_message. Raises if the server refused.
+        """
+        # MicroPython's bytearray has no find(), so search a bytes copy; this
+        # only runs once per read during the handshake
+        received = bytes(self._rx_mv[:self._rx_end])
+        header_end = received.find(b"\r\n\r\n")
+        if header_end < 0:
+            if self._rx_end == len(self._rx_buf):
+                raise Exception("websocket handshake failed")
+            return False
+        response = received[:header_end]
+        if b"101 Switching Protocols" not in response:
+            raise Exception("websocket handshake failed")
+        self.protocol = PROTOCOL_JSON
+        for line in response.split(b"\r\n"):
+            if line.lower().startswith(b"sec-websocket-protocol:"):
+                chosen = line[23:].strip().decode()
+                if chosen in self.protocols:
+                    self.protocol = chosen
+        self._rx_start = header_end + 4
+        return True
+
+    def _reset_rx(self):
+        self._rx_start = self._rx_end = 0
+        self._frag_opcode = None
+        self._frag_buf = None
         
+    def _new_mask_key(self):
+        """Fill the reusable masking key with the next 4 bytes of the entropy pool.
+
+        RFC 6455 requires unpredictable masking keys, so the pool comes from
+        os.urandom rather than the seeded random module. Refilling it is the
+        only allocation, once every MASK_POOL_SIZE // 4 frames.
+        """
+        pos = self._mask_pos
+        if pos >= MASK_POOL_SIZE:
+            self._mask_pool[:] = os.urandom(MASK_POOL_SIZE)
+            pos = 0
+        pool = self._mask_pool
+        key = self._mask_key
+        key[0] = pool[pos]
+        key[1] = pool[pos + 1]
+        key[2] = pool[pos + 2]
+        key[3] = pool[pos + 3]
+        self._mask_pos = pos + 4
+        return key
+
+    def _ensure_tx_capacity(self, length):
+        """Grow the transmit buffer if a payload doesn't fit (rare, allocates once)."""
+        if length > len(self._tx_buf) - TX_HEADROOM:
+            self._tx_buf = bytearray(TX_HEADROOM + length)
+            self._tx_mv = memoryview(self._tx_buf)
+
+    def _send_all(self, data):
+        """Write a buffer to the socket, handling partial sends."""
+        while len(data):
+            sent = self.ws.send(data)
+            if sent is None:  # MicroPython streams may return None when all data was written
+                return
+            data = data[sent:]
+
     def mask_payload(self, payload):
         """Generate a masking key and apply it to the payload."""
-        mask_key = os.urandom(4)  # generate random 4-byte masking key
-        masked_payload = bytes(b ^ mask_key[i % 4] for i, b in enumerate(payload))
-        return mask_key, masked_payload
+        mask_key = bytes(self._new_mask_key())
+        masked_payload = bytearray(payload)
+        _xor_mask(masked_payload, 0, len(masked_payload), mask_key)
+        return mask_key, bytes(masked_payload)
 
-    def send_message(self, message, opcode=0x1):
-        """Send a message with the specified opcode."""
-        # prepare the websocket frame
-        frame = bytearray()
-        frame.append(0x80 | opcode)  # FIN + opcode (0x1 for text, 0x9 for ping 0xA for pong)
-        
-        payload = message.encode("utf-8") if isinstance(message, str) else message
-        length = len(payload)
-        
+    def payload_buffer(self, length):
+        """Return a writable memoryview of the transmit buffer's payload area.
+
+        Callers can pack a payload directly into it and then call send_frame,
+        avoiding any intermediate payload object.
+        """
+        self._ensure_tx_capacity(length)
+        return self._tx_mv[TX_HEADROOM:TX_HEADROOM + length]
+
+    def _build_frame(self, length, opcode, fin):
+        """Write the header in front of the payload buffer and mask the payload.
+
+        Returns a memoryview of the complete frame.
+        """
         if length <= 125:
-            frame.append(0x80 | length)  # set MASK bit
+            header_len = 6
         elif length <= 65535:
-            frame.append(0x80 | 126)  # set MASK bit and indicate 16-bit length
-            frame.extend(struct.pack(">H", length))
+            header_len = 8
         else:
             raise ValueError("message too long")
-        
-        # mask the payload
-        mask_key, masked_payload = self.mask_payload(payload)
-        frame.extend(mask_key)  # add masking key
-        frame.extend(masked_payload)  # add masked payload
-        
+
+        buf = self._tx_buf
+        start = TX_HEADROOM - header_len
+        buf[start] = (0x80 if fin else 0x00) | opcode  # FIN + opcode (0x1 for text, 0x9 for ping 0xA for pong)
+        if length <= 125:
+            buf[start + 1] = 0x80 | length  # set MASK bit
+        else:
+            buf[start + 1] = 0x80 | 126  # set MASK bit and indicate 16-bit length
+            buf[start + 2] = length >> 8
+            buf[start + 3] = length & 0xFF
+
+        # mask the payload in place
+        mask_key = self._new_mask_key()
+        self._tx_mv[TX_HEADROOM - 4:TX_HEADROOM] = mask_key
+        _xor_mask(buf, TX_HEADROOM, length, mask_key)
+        return self._tx_mv[start:TX_HEADROOM + length]
+
+    def send_frame(self, length, opcode=0x1, fin=True):
+        """Mask and send the first length bytes of the payload buffer as one frame."""
+        frame = self._build_frame(length, opcode, fin)
         try:
-            self.ws.send(frame)
+            self._send_all(frame)
             if opcode == 0x9:  # If sending ping
                 self.last_ping_sent = time.time()
                 # print("* Ping sent")
-            elif opcode == 0xA:  # If sending pong
-                pass
-            elif opcode == 0x1:  # If sending text
-                pass
             return True
         except Exception as e:
             #print(f"* Send error: {e}")
             return False
 
-    def receive_message(self, timeout=0.1):
-        """Receive and decode a WebSocket message."""
-        # Set a short timeout for non-blocking behavior
-        self.ws.settimeout(timeout)
-        
+    def _load_payload(self, payload):
+        """Copy a payload straight into the transmit buffer behind the header."""
+        length = len(payload)
+        self._ensure_tx_capacity(length)
+        self._tx_mv[TX_HEADROOM:TX_HEADROOM + length] = payload
+        return length
+
+    def _fragments(self, payload, opcode):
+        """Yield masked frames for a payload split into max_frame_payload chunks.
+
+        Each frame lives in the transmit buffer and must be sent before the
+        next one is requested.
+        """
+        payload = memoryview(payload)
+        length = len(payload)
+        offset = 0
+        while offset < length:
+            n = min(self.max_frame_payload, length - offset)
+            self._tx_mv[TX_HEADROOM:TX_HEADROOM + n] = payload[offset:offset + n]
+            offset += n
+            yield self._build_frame(n, opcode, offset >= length)
+            opcode = 0x0  # the rest are continuation frames
+
+    def send_message(self, message, opcode=0x1):
+        """Send a message with the specified opcode.
+
+        Data messages longer than max_frame_payload are sent as a first frame
+        followed by continuation frames.
+        """
+        payload = message.encode("utf-8") if isinstance(message, str) else message
+        if len(payload) <= self.max_frame_payload:
+            return self.send_frame(self._load_payload(payload), opcode)
+
         try:
-            # Read the first byte (FIN + opcode)
-            data = self.ws.recv(1)
-            if not data:  # Connection closed
-                return False
-            
-            byte1 = data[0]
-            opcode = byte1 & 0x0F
+            for frame in self._fragments(payload, opcode):
+                self._send_all(frame)
+            return True
+        except Exception as e:
+            #print(f"* Send error: {e}")
+            return False
 
-            # Read the second byte (MASK bit + payload length)
-            data = self.ws.recv(1)
-            if not data:
-                return False
-            
-            byte2 = data[0]
-            mask = byte2 & 0x80
-            length = byte2 & 0x7F
-
-            if length == 126:
-                length = struct.unpack(">H", self.ws.recv(2))[0]
-            elif length == 127:
-                raise Exception("unsupported frame length")
-            
-            # Read the mask key if present
-            if mask:
-                mask_key = self.ws.recv(4)
-            else:
-                mask_key = None
-            
-            # Read the payload
-            payload = self.ws.recv(length) if length > 0 else b''
-            if mask_key and payload:
-                payload = bytes(b ^ mask_key[i % 4] for i, b in enumerate(payload))
+    def _rx_space(self):
+        """Return a memoryview of the free end of the receive buffer, compacting if full."""
+        if self._rx_start == self._rx_end:
+            self._rx_start = self._rx_end = 0
+        elif self._rx_end == len(self._rx_buf):
+            # Compact: move the unread tail to the front to make room
+            pending = self._rx_end - self._rx_start
+            self._rx_mv[:pending] = self._rx_mv[self._rx_start:self._rx_end]
+            self._rx_start = 0
+            self._rx_end = pending
+        return self._rx_mv[self._rx_end:]
+
+    def _fill(self):
+        """Read whatever the socket has into the free end of the receive buffer.
+
+        Returns the number of bytes read; 0 means the peer closed the connection.
+        Timeouts propagate as OSError.
+        """
+        n = self._readinto(self._rx_space())
+        if n is None:  # non-blocking stream with nothing to read
+            raise OSError(11)
+        self._rx_end += n
+        return n
+
+    def _readinto(self, buf):
+        if hasattr(self.ws, "readinto"):
+            return self.ws.readinto(buf)
+        return self.ws.recv_into(buf)
+
+    def _ensure_rx_capacity(self, size):
+        """Make sure a frame of size bytes fits in the receive buffer."""
+        if size > RX_MAX_MESSAGE + 14:
+            raise ValueError("frame too long")
+        if size > len(self._rx_buf):
+            pending = self._rx_end - self._rx_start
+            new_buf = bytearray(size)
+            new_buf[:pending] = self._rx_mv[self._rx_start:self._rx_end]
+            self._rx_buf = new_buf
+            self._rx_mv = memoryview(new_buf)
+            self._rx_start = 0
+            self._rx_end = pending
+
+    def _next_frame(self):
+        """Parse one complete frame from the receive buffer.
+
+        Returns (fin, opcode, payload) with payload a memoryview into the
+        buffer that is valid until the next fill, or None if more data is needed.
+        """
+        buf = self._rx_buf
+        start = self._rx_start
+        available = self._rx_end - start
+        if available < 2:
+            return None
+
+        byte1 = buf[start]
+        byte2 = buf[start + 1]
+        length = byte2 & 0x7F
+        pos = start + 2
+        if length == 126:
+            if available < 4:
+                return None
+            length = (buf[pos] << 8) | buf[pos + 1]
+            pos += 2
+        elif length == 127:
+            if available < 10:
+                return None
+            length = struct.unpack_from(">Q", buf, pos)[0]
+            pos += 8
+        mask = byte2 & 0x80
+        if mask:
+            pos += 4
+
+        frame_end = pos + length
+        if frame_end - start > available:
+            self._ensure_rx_capacity(frame_end - start)
+            return None
+
+        if mask:
+            _xor_mask(buf, pos, length, self._rx_mv[pos - 4:pos])
+        self._rx_start = frame_end
+        return byte1 & 0x80, byte1 & 0x0F, self._rx_mv[pos:frame_end]
+
+    def _process_frames(self):
+        """Handle buffered frames until a complete data message is found.
+
+        Returns the decoded message, None if more data is needed, or False if
+        the connection was closed.
+        """
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return None
+            fin, opcode, payload = frame
 
-            # Handle control frames
+            # Handle control frames; these may arrive between fragments
             if opcode == 0x8:  # Close frame
                 #print("* Received close frame")
                 return False
             elif opcode == 0x9:  # Ping frame
                 # print("* Received ping, sending pong")
-                self.send_message(payload, opcode=0xA)  # Send pong with the same payload
-                return None  # Continue receiving
+                self._handle_ping(payload)
+                continue
             elif opcode == 0xA:  # Pong frame
                 # print("* Received pong")
-                self.last_pong_received = time.time()
-                return None  # Continue receiving
-            elif opcode == 0x1 or opcode == 0x2:  # Text or binary frame
-                return payload.decode("utf-8") if opcode == 0x1 else payload
+                self._handle_pong()
+                continue
+
+            if opcode == 0x1 or opcode == 0x2:  # Text or binary frame
+                if fin:
+                    if self._accepts(opcode):
+                        return self._decode(opcode, payload)
+                    self.rejected += 1
+                    continue
+                self._frag_opcode = opcode
+                self._frag_buf = bytearray(payload)
+            elif opcode == 0x0:  # Continuation frame
+                if self._frag_opcode is None:
+                    print("* Unexpected continuation frame")
+                    continue
+                if len(self._frag_buf) + len(payload) > RX_MAX_MESSAGE:
+                    raise ValueError("message too long")
+                self._frag_buf.extend(payload)
+                if fin:
+                    opcode = self._frag_opcode
+                    message = self._decode(opcode, self._frag_buf)
+                    self._frag_opcode = None
+                    self._frag_buf = None
+                    if self._accepts(opcode):
+                        return message
+                    self.rejected += 1
             else:
                 print(f"* Unsupported opcode: {opcode}")
-                return None
-                
+
+    def _handle_ping(self, payload):
+        self.send_message(payload, opcode=0xA)  # Send pong with the same payload
+
+    def _handle_pong(self):
+        self.last_pong_received = time.time()
+
+    def _accepts(self, opcode):
+        """Text messages are always JSON; binary ones only under the binary subprotocol."""
+        return opcode == 0x1 or self.protocol == PROTOCOL_BINARY
+
+    def _decode(self, opcode, payload):
+        return str(payload, "utf-8") if opcode == 0x1 else bytes(payload)
+
+    def receive_message(self, timeout=0.1):
+        """Receive and decode a WebSocket message.
+
+        Frames already buffered are returned without touching the socket;
+        otherwise waits up to timeout seconds for more data.
+        """
+        message = self._buffered_message()
+        if message is not None:
+            return message
+
+        try:
+            # Set a short timeout for non-blocking behavior
+            self.ws.settimeout(timeout)
+            if not self._fill():  # Connection closed
+                return False
+            return self._process_frames()
+
         except OSError as e:
             # Socket timeout is expected (no data available)
-            if e.args[0] == 110:  # ETIMEDOUT
+            if e.args and e.args[0] in _TIMEOUT_ERRORS:
                 return None
             #print(f"* Receive error: {e}")
             return False  # Indicate connection issue
@@ -157,6 +477,25 @@ class WebSocketClient:
             #print(f"* Unexpected receive error: {e}")
             return False
 
+    def receive_messages(self, timeout=0):
+        """Generator yielding every complete message available after one socket read.
+
+        Yields False and stops if the connection has failed.
+        """
+        message = self.receive_message(timeout)
+        while message is not None:
+            yield message
+            if message is False:
+                return
+            message = self._buffered_message()
+
+    def _buffered_message(self):
+        """Next message from already-buffered data only, never touching the socket."""
+        try:
+            return self._process_frames()
+        except Exception as e:
+            return False
+
     def check_connection(self):
         """Check WebSocket connection health with ping/pong mechanism."""
         current_time = time.time()
@@ -175,42 +514,23 @@ class WebSocketClient:
             
         return True
 
-    def handle_websocket(self):
+    def handle_websocket(self, timeout=0.1):
         """Process incoming messages and check connection health.
+
+        Drains every pending message into self.mailbox, so the result is the
+        latest merged control state rather than the oldest queued message.
         Returns:
             - False if connection issue
-            - String if valid JSON message received
+            - Dict of the merged control state if new messages were received
             - None if no message but connection is fine
         """
-        # Process any incoming messages
-        for _ in range(5):  # Check a few times for any pending messages
-            message = self.receive_message(timeout=0.1)
-            
-            if message is False:  # Connection issue
-                return False
-            elif message is not None:  # Actual message received
-                try:
-                    # Check if message is bytes or string and handle accordingly
-                    if isinstance(message, bytes):
-                        json_data = ujson.loads(message.decode("utf-8"))
-                    else:
-                        json_data = ujson.loads(message)
-                    
-                    # Here, we'll return the string form of the JSON data
-                    # You can customize this to return specific fields from json_data
-                    return json_data
-                    
-                except ValueError as e:
-                    # If JSON parsing fails, continue to next iteration
-                    pass
+        # Process all incoming messages
+        if not self.mailbox.drain(self, timeout):  # Connection issue
+            return False
         
         # Check connection health
         if not self.check_connection():
             return False
         
-        # If no message was received but connection is fine, return None
-        return None
-
-
-
-
+        # None if no message was received but connection is fine
+        return self.mailbox.take()
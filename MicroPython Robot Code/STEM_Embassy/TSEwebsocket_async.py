@@ -0,0 +1,141 @@
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+import time
+
+from TSEwebsocket import WebSocketClient
+
+
+class AsyncWebSocketClient(WebSocketClient):
+    """asyncio variant of WebSocketClient built on stream readers and writers.
+
+    Framing, masking and the receive buffer are shared with WebSocketClient;
+    only the transport is different. Iterate with ``async for`` to get decoded
+    messages, run keepalive() as its own task and await send() to transmit.
+    last_ping_sent and last_pong_received are time.ticks_ms() values here.
+    """
+
+    def __init__(self, host, port, path, binary=True):
+        super().__init__(host, port, path, binary)
+        self.reader = None
+        self.writer = None
+        self.connected = False
+        # Incremented on every successful connect, so per-connection tasks
+        # can tell that the link they were started for has gone
+        self.generation = 0
+        self._send_lock = asyncio.Lock()
+        self._pending_pong = None
+
+    async def connect(self, timeout=5):
+        """Open the stream and perform the WebSocket handshake."""
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.wsHost, self.wsPort), timeout)
+            sock = getattr(self.writer, "s", None) or self.writer.get_extra_info("socket")
+            self._set_nodelay(sock)
+            self.writer.write(self._handshake_request())
+            await self.writer.drain()
+
+            self._reset_rx()
+            while not self._handshake_response_complete():
+                if not await asyncio.wait_for(self._fill_async(), timeout):
+                    raise Exception("websocket handshake failed")
+
+            self.connected = True
+            self.generation += 1
+            self.last_ping_sent = self.last_pong_received = time.ticks_ms()
+            print("* WS connected!")
+            return True
+        except Exception as e:
+            print(f"* WS connection error: {e}")
+            self.close()
+            return False
+
+    def close(self):
+        self.connected = False
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.reader = None
+
+    async def _fill_async(self):
+        """Await more data from the stream into the receive buffer."""
+        space = self._rx_space()
+        if hasattr(self.reader, "readinto"):
+            n = await self.reader.readinto(space)
+        else:
+            data = await self.reader.read(len(space))
+            n = len(data)
+            space[:n] = data
+        self._rx_end += n
+        return n
+
+    def _handle_ping(self, payload):
+        # Can't await here; the receive loop sends the pong once parsing stops
+        self._pending_pong = bytes(payload)
+
+    def _handle_pong(self):
+        # ticks_ms rather than time.time(), whose whole seconds can't order a
+        # ping and its pong when they straddle a second boundary
+        self.last_pong_received = time.ticks_ms()
+
+    async def send(self, message, opcode=0x1):
+        """Send a message with the specified opcode. Returns False if the link is down."""
+        if not self.connected:
+            return False
+        payload = message.encode("utf-8") if isinstance(message, str) else message
+        async with self._send_lock:
+            if opcode == 0x9:  # If sending ping
+                # Before writing, so a pong handled while drain() yields is never older
+                self.last_ping_sent = time.ticks_ms()
+            try:
+                if len(payload) <= self.max_frame_payload:
+                    self.writer.write(self._build_frame(self._load_payload(payload), opcode, True))
+                    await self.writer.drain()
+                else:
+                    for frame in self._fragments(payload, opcode):
+                        self.writer.write(frame)
+                        await self.writer.drain()
+            except Exception as e:
+                #print(f"* Send error: {e}")
+                self.close()
+                return False
+        return True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while self.connected:
+            message = self._buffered_message()
+            if self._pending_pong is not None:
+                pong, self._pending_pong = self._pending_pong, None
+                await self.send(pong, opcode=0xA)
+            if message is False:
+                break
+            if message is not None:
+                return message
+            try:
+                if not await self._fill_async():  # Connection closed
+                    break
+            except Exception as e:
+                #print(f"* Receive error: {e}")
+                break
+        self.close()
+        raise StopAsyncIteration
+
+    async def keepalive(self):
+        """Send a ping every ping_interval and drop the link if no pong arrives in pong_timeout."""
+        generation = self.generation
+        while self.connected and self.generation == generation:
+            if not await self.send("heartbeat", opcode=0x9):
+                break
+            await asyncio.sleep(self.pong_timeout)
+            if self.generation != generation:
+                break
+            if time.ticks_diff(self.last_pong_received, self.last_ping_sent) < 0:
+                #print("* Pong timeout - connection may be dead")
+                self.close()
+                break
+            await asyncio.sleep(self.ping_interval - self.pong_timeout)
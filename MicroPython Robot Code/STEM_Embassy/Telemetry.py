@@ -0,0 +1,152 @@
+"""
+Batched binary telemetry uplink over a WebSocketClient
+
+Each batch is sent as one binary (opcode 0x2) message, fragmented into
+continuation frames by the client when it is larger than a single frame.
+
+Batch layout, little endian:
+    header  TELEMETRY_HEADER_FORMAT  magic, version, record count, record size
+    records TELEMETRY_RECORD_FORMAT  repeated record count times:
+        uint32   timestamp (ticks_ms)
+        int32    left, right encoder position (counts)
+        float32  yaw, pitch, roll (degrees)
+        uint16   rangefinder distance (mm, 65535 = no echo)
+        uint16   left, right reflectance (0 white - 65535 black)
+        uint16   red, green, blue, clear color counts
+"""
+
+import time
+import ustruct
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+TELEMETRY_MAGIC = 0xB2
+TELEMETRY_VERSION = 1
+TELEMETRY_HEADER_FORMAT = "<BBHH"
+TELEMETRY_HEADER_SIZE = 6
+TELEMETRY_RECORD_FORMAT = "<Iiifff7H"
+TELEMETRY_RECORD_SIZE = 38
+
+
+class TelemetryUplink:
+
+    def __init__(self, ws, drivetrain=None, imu=None, rangefinder=None, reflectance=None,
+                 color_sensor=None, rate_hz: int = 100, batch_size: int = 10):
+        """Sample robot state into fixed-size binary records and send them in batches.
+
+        Any sensor left as None is reported as zeros.
+
+        Args:
+            ws: The connected WebSocketClient or AsyncWebSocketClient to send on
+            drivetrain: DifferentialDrive providing encoder positions
+            imu: IMU providing yaw, pitch and roll
+            rangefinder: Rangefinder providing distance
+            reflectance: Reflectance providing left/right readings
+            color_sensor: TCS34725 providing RGBC counts; should be in background sampling mode so reads don't block
+            rate_hz: Samples per second
+            batch_size: Records per message
+        """
+        self.ws = ws
+        self.drivetrain = drivetrain
+        self.imu = imu
+        self.rangefinder = rangefinder
+        self.reflectance = reflectance
+        self.color_sensor = color_sensor
+
+        self.period_ms = 1000 // rate_hz
+        self.batch_size = batch_size
+        self._buf = bytearray(TELEMETRY_HEADER_SIZE + batch_size * TELEMETRY_RECORD_SIZE)
+        self._mv = memoryview(self._buf)
+        self._count = 0
+        self._next_sample = time.ticks_ms()
+
+        # Counters
+        self.samples = 0
+        self.batches_sent = 0
+        self.send_failures = 0
+
+    def sample(self):
+        """Pack the current robot state as the next record in the batch.
+
+        Returns:
+            True if the batch is now full and ready to send
+        """
+        left = right = 0
+        yaw = pitch = roll = 0.0
+        distance = 0
+        refl_left = refl_right = 0
+        r = g = b = c = 0
+
+        if self.drivetrain is not None:
+            left = self.drivetrain.left_motor.get_position_counts()
+            right = self.drivetrain.right_motor.get_position_counts()
+        if self.imu is not None:
+            yaw = self.imu.get_yaw()
+            pitch = self.imu.get_pitch()
+            roll = self.imu.get_roll()
+        if self.rangefinder is not None:
+            distance = min(int(self.rangefinder.distance() * 10), 65535)
+        if self.reflectance is not None:
+            refl_left = min(int(self.reflectance.get_left() * 65536), 65535)
+            refl_right = min(int(self.reflectance.get_right() * 65536), 65535)
+        if self.color_sensor is not None:
+            r, g, b, c = self.color_sensor.read_rgbc()
+
+        offset = TELEMETRY_HEADER_SIZE + self._count * TELEMETRY_RECORD_SIZE
+        ustruct.pack_into(TELEMETRY_RECORD_FORMAT, self._buf, offset,
+                          time.ticks_ms() & 0xFFFFFFFF, left, right, yaw, pitch, roll,
+                          distance, refl_left, refl_right, r, g, b, c)
+        self._count += 1
+        self.samples += 1
+        return self._count >= self.batch_size
+
+    def take_batch(self):
+        """Finish the current batch and start a new one.
+
+        Returns:
+            Memoryview of the encoded batch, valid until the next call to sample()
+        """
+        ustruct.pack_into(TELEMETRY_HEADER_FORMAT, self._buf, 0, TELEMETRY_MAGIC,
+                          TELEMETRY_VERSION, self._count, TELEMETRY_RECORD_SIZE)
+        length = TELEMETRY_HEADER_SIZE + self._count * TELEMETRY_RECORD_SIZE
+        self._count = 0
+        return self._mv[:length]
+
+    def _record_send(self, ok):
+        if ok:
+            self.batches_sent += 1
+        else:
+            self.send_failures += 1
+        return ok
+
+    def poll(self):
+        """Non-blocking update for synchronous loops using WebSocketClient.
+
+        Call as often as possible; samples when the next period is due and sends once a
+        batch is full.
+
+        Returns:
+            False if sending failed, otherwise True
+        """
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self._next_sample) < 0:
+            return True
+        self._next_sample = time.ticks_add(self._next_sample, self.period_ms)
+        if time.ticks_diff(now, self._next_sample) > 0:
+            # Fell more than a period behind; don't try to catch up with a burst
+            self._next_sample = time.ticks_add(now, self.period_ms)
+        if self.sample():
+            return self._record_send(self.ws.send_message(self.take_batch(), opcode=0x2))
+        return True
+
+    async def run(self):
+        """Sampling task for AsyncWebSocketClient. Runs until the connection drops."""
+        generation = self.ws.generation
+        while self.ws.connected and self.ws.generation == generation:
+            start = time.ticks_ms()
+            if self.sample():
+                self._record_send(await self.ws.send(self.take_batch(), opcode=0x2))
+            elapsed = time.ticks_diff(time.ticks_ms(), start)
+            await asyncio.sleep_ms(max(0, self.period_ms - elapsed))
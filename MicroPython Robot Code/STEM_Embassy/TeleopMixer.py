@@ -0,0 +1,124 @@
+"""
+Table-driven teleop mixer with slew-rate limiting
+"""
+
+import time
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+from ControlProtocol import KEY_W, KEY_A, KEY_S, KEY_D
+
+
+def _key_effort(mask):
+    # Opposite keys cancel each other out
+    forward = (1 if mask & KEY_W else 0) - (1 if mask & KEY_S else 0)
+    turn = (1 if mask & KEY_A else 0) - (1 if mask & KEY_D else 0)
+    if forward == 0:
+        # Pivot on one wheel
+        return (0, 1) if turn > 0 else (1, 0) if turn < 0 else (0, 0)
+    if turn > 0:
+        return 0.3 * forward, forward
+    if turn < 0:
+        return forward, 0.3 * forward
+    return forward, forward
+
+
+# (left, right) effort for every combination of the w/a/s/d key bits
+KEY_EFFORTS = tuple(_key_effort(mask) for mask in range(16))
+
+
+def key_mask(state):
+    """Pack the "w", "a", "s", "d" entries of a control state into a KEY_* bitmask."""
+    return ((KEY_W if state["w"] else 0) | (KEY_A if state["a"] else 0) |
+            (KEY_S if state["s"] else 0) | (KEY_D if state["d"] else 0))
+
+
+class TeleopMixer:
+
+    def __init__(self, drivetrain, slew_rate: float = 4.0, tick_hz: int = 50):
+        """Turn operator input into drivetrain efforts.
+
+        Keys are looked up in KEY_EFFORTS, joystick axes go through
+        DifferentialDrive.arcade_efforts. Each wheel's effort then ramps towards its target
+        by at most slew_rate per second on a fixed tick. Reducing effort is never limited,
+        so stopping is immediate, and reversing drops to zero first and then ramps up.
+
+        Args:
+            drivetrain: The DifferentialDrive to control
+            slew_rate: Maximum increase in effort per second (4.0 goes from 0 to full in 250 ms)
+            tick_hz: Update rate of the slew limiter
+        """
+        self.drivetrain = drivetrain
+        self.period_ms = 1000 // tick_hz
+        self.max_step = slew_rate / tick_hz
+
+        self.target_left = 0
+        self.target_right = 0
+        self.left = 0
+        self.right = 0
+
+    def set_keys(self, mask: int):
+        """Set the target from the pressed keys.
+
+        Args:
+            mask: Bitmask of pressed keys (KEY_W | KEY_A | KEY_S | KEY_D)
+        """
+        self.target_left, self.target_right = KEY_EFFORTS[mask & 0x0F]
+
+    def set_axes(self, straight: float, turn: float):
+        """Set the target from the joystick axes.
+
+        Args:
+            straight: Joystick forward axis, -1 to 1
+            turn: Joystick turn axis, -1 to 1, positive turns left
+        """
+        self.target_left, self.target_right = self.drivetrain.arcade_efforts(straight, turn)
+
+    def apply(self, state):
+        """Set the target from a control state dict.
+
+        Joystick axes win over keys when either is non-zero.
+
+        Args:
+            state: Control state dict, as taken from a ControlMailbox
+        """
+        straight = state.get("straight", 0)
+        turn = state.get("turn", 0)
+        if straight or turn:
+            self.set_axes(straight, turn)
+        else:
+            self.set_keys(key_mask(state))
+
+    def stop(self):
+        """Zero the target and the output immediately, bypassing the slew limiter."""
+        self.target_left = self.target_right = 0
+        self.left = self.right = 0
+        self.drivetrain.set_effort(0, 0)
+
+    def _slew(self, current, target):
+        if target * current < 0:
+            # Reversing: cut to zero first
+            return 0
+        if abs(target) <= abs(current):
+            return target
+        if target > current:
+            return min(target, current + self.max_step)
+        return max(target, current - self.max_step)
+
+    def tick(self):
+        """Advance the slew limiter by one tick and apply the result if it changed."""
+        left = self._slew(self.left, self.target_left)
+        right = self._slew(self.right, self.target_right)
+        if left != self.left or right != self.right:
+            self.left = left
+            self.right = right
+            self.drivetrain.set_effort(left, right)
+
+    async def run(self):
+        """Tick forever at the configured rate."""
+        while True:
+            start = time.ticks_ms()
+            self.tick()
+            await asyncio.sleep_ms(max(0, self.period_ms - time.ticks_diff(time.ticks_ms(), start)))
@@ -0,0 +1,84 @@
+"""
+Command watchdog (deadman stop) for teleop
+"""
+
+import time
+from machine import Timer
+
+
+class CommandWatchdog:
+
+    def __init__(self, on_timeout, deadline_ms: int = 250, check_hz: int = 100):
+        """Call on_timeout once if feed() hasn't been called for deadline_ms.
+
+        The check runs from a virtual timer, so it still fires when the main loop
+        or asyncio scheduler is stuck behind something else. The watchdog re-arms
+        on the next feed().
+
+        Args:
+            on_timeout: Called with no arguments when the deadline is missed; should stop the robot
+            deadline_ms: How long without a fresh command before stopping
+            check_hz: How often the deadline is checked; bounds the reaction time at 1000/check_hz ms
+        """
+        self.on_timeout = on_timeout
+        self.deadline_ms = deadline_ms
+        self.check_hz = check_hz
+
+        self._last_feed = time.ticks_ms()
+        self._armed = False
+
+        # Reaction latency: how long past the deadline the stop was issued
+        self.trips = 0
+        self.last_reaction_ms = 0
+        self.max_reaction_ms = 0
+        self._total_reaction_ms = 0
+
+        # A timer ID of -1 is a virtual timer.
+        # Leaves the hardware timers for more important uses
+        self._timer = Timer(-1)
+
+    def start(self):
+        """Start checking the deadline. Not armed until the first feed()."""
+        self._timer.init(freq=self.check_hz, mode=Timer.PERIODIC, callback=lambda t: self._check())
+
+    def stop(self):
+        """Stop checking the deadline."""
+        self._timer.deinit()
+        self._armed = False
+
+    def feed(self):
+        """Record a fresh command, pushing the deadline back."""
+        self._last_feed = time.ticks_ms()
+        self._armed = True
+
+    def is_tripped(self) -> bool:
+        """Returns:
+            True if the deadline was missed and no command has arrived since
+        """
+        return not self._armed and self.trips > 0
+
+    def _check(self):
+        if not self._armed:
+            return
+        if time.ticks_diff(time.ticks_ms(), self._last_feed) < self.deadline_ms:
+            return
+        self._armed = False
+        self.on_timeout()
+        # Measured once the stop has been issued
+        late_ms = time.ticks_diff(time.ticks_ms(), self._last_feed) - self.deadline_ms
+        self.trips += 1
+        self.last_reaction_ms = late_ms
+        self._total_reaction_ms += late_ms
+        if late_ms > self.max_reaction_ms:
+            self.max_reaction_ms = late_ms
+
+    def stats(self):
+        """Returns:
+            Dict of the trip count and reaction latency past the deadline (last, mean, max) in ms
+        """
+        return {
+            "trips": self.trips,
+            "last_reaction_ms": self.last_reaction_ms,
+            "mean_reaction_ms": self._total_reaction_ms / self.trips if self.trips else 0,
+            "max_reaction_ms": self.max_reaction_ms,
+        }
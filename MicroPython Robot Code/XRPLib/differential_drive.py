@@ -104,13 +104,24 @@ class DifferentialDrive:
         :param turn: The modifier effort (Bounded from -1 to 1) used to skew robot left (positive) or right (negative).
         :type turn: float
         """
+        left_speed, right_speed = self.arcade_efforts(straight, turn)
+        self.set_effort(left_speed, right_speed)
+
+    def arcade_efforts(self, straight:float, turn:float) -> tuple:
+        """
+        Computes the motor efforts for the arcade drive scheme without applying them
+
+        :param straight: The base effort (Bounded from -1 to 1) used to drive forwards or backwards.
+        :type straight: float
+        :param turn: The modifier effort (Bounded from -1 to 1) used to skew robot left (positive) or right (negative).
+        :type turn: float
+        :return: The (left, right) efforts
+        :rtype: tuple<float>
+        """
         if straight == 0 and turn == 0:
-            self.set_effort(0, 0)
-        else:
-            scale = max(abs(straight), abs(turn))/(abs(straight) + abs(turn))
-            left_speed = (straight - turn)*scale
-            right_speed = (straight + turn)*scale
-            self.set_effort(left_speed, right_speed)
+            return 0, 0
+        scale = max(abs(straight), abs(turn))/(abs(straight) + abs(turn))
+        return (straight - turn)*scale, (straight + turn)*scale
 
     def reset_encoder_position(self) -> None:
         """
@@ -4,10 +4,18 @@ import machine
 import rp2
 import time
 
+# PIO state machine EXECCTRL registers, used to point STATUS at the TX FIFO level
+_PIO_BASES = (0x50200000, 0x50300000)
+_SM_EXECCTRL = 0x0CC
+_SM_STRIDE = 0x18
+
 class Encoder:
     _gear_ratio = (30/14) * (28/16) * (36/9) * (26/8) # 48.75
     _counts_per_motor_shaft_revolution = 12
     resolution = _counts_per_motor_shaft_revolution * _gear_ratio # 585
+
+    # Encoders by state machine index, for read_all()
+    _INSTANCES = [None, None, None, None]
     
     def __init__(self, index, encAPin: int|str, encBPin: int|str):
         """
@@ -26,8 +34,14 @@ class Encoder:
         basePin = machine.Pin(min(encAPin, encBPin), machine.Pin.IN)
         nextPin = machine.Pin(max(encAPin, encBPin), machine.Pin.IN)
         self.sm = rp2.StateMachine(index, self._encoder, in_base=basePin)
+        # The program checks STATUS for a read request: all ones while the TX FIFO holds fewer
+        # than 1 word (STATUS_SEL = TX level, STATUS_N = 1). Setting the low 7 bits this way
+        # is valid on both the RP2040 and the RP2350
+        execctrl = _PIO_BASES[index // 4] + _SM_EXECCTRL + _SM_STRIDE * (index % 4)
+        machine.mem32[execctrl] = (machine.mem32[execctrl] & ~0x7F) | 1
         self.reset_encoder_position()
         self.sm.active(1)
+        Encoder._INSTANCES[index] = self
     
     def reset_encoder_position(self):
         """
@@ -38,20 +52,35 @@ class Encoder:
         # problem, an alternative solution is to stop the state machine, then
         # reset both x and the program counter. But that's excessive.
         self.sm.exec("set(x, 0)")
+
+    def _request(self):
+        # A count left over from an interrupted read would answer this request instead
+        while self.sm.rx_fifo():
+            self.sm.get()
+        self.sm.put(0)
+
+    def _receive(self):
+        # The state machine answers within a few cycles of a request, so an empty FIFO here means
+        # the answer was taken by another read. Ask again rather than block forever in get()
+        if not self.sm.rx_fifo():
+            self.sm.put(0)
+        counts = self.sm.get()
+        if(counts > 2**31):
+            counts -= 2**32
+        return counts
     
     def get_position_counts(self):
         """
         :return: The position of the encoded motor, in counts, relative to the last time reset was called.
         :rtype: int
         """
-        # Read 5 times for it to get past the buffer
-        counts = self.sm.get()
-        counts = self.sm.get()
-        counts = self.sm.get()
-        counts = self.sm.get()
-        counts = self.sm.get()
-        if(counts > 2**31):
-            counts -= 2**32
+        # The state machine only pushes the count when asked, so one request and one pop
+        # return the current count. Interrupts are off so a motor's update timer cannot
+        # take the answer in between
+        state = machine.disable_irq()
+        self._request()
+        counts = self._receive()
+        machine.enable_irq(state)
         return counts
     
     def get_position(self):
@@ -61,12 +90,36 @@ class Encoder:
         """
         return self.get_position_counts() / self.resolution
 
+    @classmethod
+    def read_all(cls):
+        """
+        Sample every encoder at the same moment: all state machines are asked for their count
+        before any answer is read, so the counts are taken microseconds apart.
+
+        :return: The counts of encoders 0-3, None for an index with no encoder
+        :rtype: list
+        """
+        encoders = cls._INSTANCES
+        counts = [None, None, None, None]
+        # Requests and answers as one block, so an update timer reading an encoder in between
+        # cannot take an answer meant for this call
+        state = machine.disable_irq()
+        for encoder in encoders:
+            if encoder is not None:
+                encoder._request()
+        for i in range(4):
+            if encoders[i] is not None:
+                counts[i] = encoders[i]._receive()
+        machine.enable_irq(state)
+        return counts
+
     @rp2.asm_pio(in_shiftdir=rp2.PIO.SHIFT_LEFT, out_shiftdir=rp2.PIO.SHIFT_RIGHT)
     def _encoder():
         # Register descriptions:
         # X - Encoder count, as a 32-bit number
-        # OSR - Previous pin values, only last 2 bits are used
-        # ISR - Push encoder count, and combine pin states together
+        # Y - Read request check, then previous pin values while the count is pushed
+        # OSR - Previous pin values, only last 2 bits are used. Also takes the read request word
+        # ISR - Combine pin states together, and push encoder count
         
         # Jump table
         # The program counter is moved to memory address 0000 - 1111, based
@@ -91,29 +144,33 @@ class Encoder:
         jmp("decr") # 11 -> 10 Reverse, decrement count
         jmp("read") # 11 -> 11 No change, continue
         
+        label("decr")           # Decrement X in the jump instruction. Whether it jumps or
+        jmp(x_dec, "read")      # falls through, the next instruction is "read"
+        
+        wrap_target()
         label("read")
-        mov(osr, isr)   # Store previous pin states in OSR
-        mov(isr, x)     # Copy encoder count to ISR
-        push(noblock)   # Push count to RX buffer, and reset ISR to 0
-        out(isr, 2)     # Shift previous pin states into ISR
-        in_(pins, 2)    # Shift current pin states into ISR
-        mov(pc, isr)    # Move PC to jump table to determine what to do next
+        mov(y, status)          # All ones unless a read request is waiting in the TX FIFO
+        jmp(not_y, "send")
+        label("track")
+        mov(osr, isr)           # Store previous pin states in OSR
+        out(isr, 2)             # Shift previous pin states into ISR
+        in_(pins, 2)            # Shift current pin states into ISR
+        mov(pc, isr)            # Move PC to jump table to determine what to do next
         
-        label("decr")           # There is no explicite increment intruction, but X can be
-        jmp(x_dec, "decr_nop")  # decremented in the jump instruction. So we use that and jump
-        label("decr_nop")       # to the next instruction, which is equivalent to just decrementing
-        jmp("read")
+        label("send")
+        pull(noblock)           # Take the read request
+        mov(y, isr)             # Keep the pin states while ISR holds the count
+        mov(isr, x)             # Copy encoder count to ISR
+        push(noblock)           # Push count to RX buffer
+        mov(isr, y)
+        jmp("track")
         
         label("incr")           # There is no explicite increment intruction, but X can be
         mov(x, invert(x))       # decremented in the jump instruction. So we invert X, decrement, 
         jmp(x_dec, "incr_nop")  # then invert again - this is equivalent to incrementing.
         label("incr_nop")
         mov(x, invert(x))
-        jmp("read")
+        wrap()                  # Back to "read"
         
-        # Fill remaining instruction memory with jumps to ensure nothing bad happens
-        # For some reason, weird behavior happens if the instruction memory isn't full
-        jmp("read")
-        jmp("read")
-        jmp("read")
-        jmp("read")
\ No newline at end of file
+        # The program fills all 32 instructions, so it is always loaded at address 0
+        # where "mov(pc, isr)" expects the jump table
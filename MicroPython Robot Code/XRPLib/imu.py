@@ -5,12 +5,27 @@
 # v1.0 2019.7
 try:
     from .imu_defs import *
-    from uctypes import struct, addressof
+    from uctypes import struct, addressof, LITTLE_ENDIAN
+    from micropython import schedule
 except (TypeError, ModuleNotFoundError):
     # Import wrapped in a try/except so that autodoc generation can process properly
     pass
 from machine import I2C, Pin, Timer, disable_irq, enable_irq
 import time, math
+import ustruct
+import json
+from array import array
+
+# Integrator magnitude at which the integer gyro integrals are folded into the float angles,
+# well inside small-int range so the timer callback never creates a long int
+_FOLD_LIMIT = 1 << 28
+
+_CALIBRATION_VERSION = 1
+
+
+def _s16(lo, hi):
+    v = lo | (hi << 8)
+    return v - 0x10000 if v & 0x8000 else v
 
 class IMU():
 
@@ -24,7 +39,11 @@ class IMU():
 
         if cls._DEFAULT_IMU_INSTANCE is None:
             cls._DEFAULT_IMU_INSTANCE = cls()  
-            cls._DEFAULT_IMU_INSTANCE.calibrate()
+            # Use the calibration saved on flash when it still applies, and only
+            # spend a second calibrating when it doesn't
+            if not cls._DEFAULT_IMU_INSTANCE.load_calibration():
+                cls._DEFAULT_IMU_INSTANCE.calibrate()
+                cls._DEFAULT_IMU_INSTANCE.save_calibration()
         return cls._DEFAULT_IMU_INSTANCE
 
     def __init__(self, scl_pin: int|str = "I2C_SCL_1", sda_pin: int|str = "I2C_SDA_1", addr=LSM_ADDR_PRIMARY):
@@ -33,20 +52,79 @@ class IMU():
         self.addr = addr
 
         # Initialize member variables
+        self.timer_frequency = 208
+        self.calibration_file = "imu_calibration.json"
         self._reset_member_variables()
 
         # Transmit and recieve buffers
         self.tb = bytearray(1)
         self.rb = bytearray(1)
 
-        # Copies of registers. Bytes and structs share the same memory
-        # addresses, so changing one changes the other
-        self.reg_ctrl1_xl_byte   = bytearray(1)
-        self.reg_ctrl2_g_byte    = bytearray(1)
-        self.reg_ctrl3_c_byte    = bytearray(1)
-        self.reg_ctrl1_xl_bits   = struct(addressof(self.reg_ctrl1_xl_byte), LSM_REG_LAYOUT_CTRL1_XL)
-        self.reg_ctrl2_g_bits    = struct(addressof(self.reg_ctrl2_g_byte), LSM_REG_LAYOUT_CTRL2_G)
-        self.reg_ctrl3_c_bits    = struct(addressof(self.reg_ctrl3_c_byte), LSM_REG_LAYOUT_CTRL3_C)
+        # Burst buffer for the gyro + accel output registers, with a signed 16-bit view over it
+        # so the timer callback can read samples without allocating
+        self._data_buf = bytearray(LSM_OUT_SIZE)
+        self._data = struct(addressof(self._data_buf), LSM_OUT_LAYOUT, LITTLE_ENDIAN)
+        self._rates_buf = bytearray(6)
+
+        # FIFO streaming state, see start_fifo()
+        self._fifo_active = False
+        self._fifo_buf = None
+        self._fifo_mv = None
+        self._fifo_status = bytearray(2)
+        self._fifo_pin = None
+        self._fifo_prev_frequency = 0
+        self._fifo_last_ts = -1
+        self.fifo_drains = 0
+        self.fifo_samples = 0
+        self.fifo_overruns = 0
+        self.fifo_period_us = 0
+
+        # Timer integration statistics, see integration_stats()
+        self.ticks = 0
+        self.missed_samples = 0
+        self.max_dt_us = 0
+        self._dt_count = 0
+        self._dt_sum_us = 0
+        self._dt_total_us = 0.0
+
+        # History ring buffer, see start_history(). _hist_size == 0 means off
+        self._hist_size = 0
+        self._hist_next = 0
+        self._hist_count = 0
+        self._hist_ticks = None
+        self._hist_int = None
+        self._hist_raw = None
+        self._hist_epoch = None
+        # Entries store the integer integrals; an epoch holds the float angles and scale they are
+        # relative to, and a new one starts whenever the integrals are folded or the angles set
+        self._epoch = 0
+        self._epoch_used = False
+        self._epoch_size = 0
+        self._epoch_base = None
+        self._epoch_k = None
+
+        # Fusion filter state, see set_fusion()
+        self._fusion = None
+        self._fusion_decimation = 4
+        self._fusion_count = 0
+        self._fusion_us = 0
+        self._fusion_gx = self._fusion_gy = self._fusion_gz = 0
+        self._fusion_ax = self._fusion_ay = self._fusion_az = 0
+
+        # Shadow copies of CTRL1_XL, CTRL2_G and CTRL3_C, which are consecutive registers.
+        # The shadow is authoritative: it is loaded once after a reset, changed in memory and
+        # written back by _write_ctrl(), so getters never touch the bus. _ctrl_written holds
+        # what the sensor has, so only changed bytes are sent. Bytes and structs share the same
+        # memory addresses, so changing one changes the other
+        self._ctrl_shadow        = bytearray(3)
+        self._ctrl_written       = bytearray(3)
+        self._ctrl_mv            = memoryview(self._ctrl_shadow)
+        self.reg_ctrl1_xl_byte   = self._ctrl_mv[0:1]
+        self.reg_ctrl2_g_byte    = self._ctrl_mv[1:2]
+        self.reg_ctrl3_c_byte    = self._ctrl_mv[2:3]
+        self.reg_ctrl1_xl_bits   = struct(addressof(self._ctrl_shadow), LSM_REG_LAYOUT_CTRL1_XL)
+        self.reg_ctrl2_g_bits    = struct(addressof(self._ctrl_shadow) + 1, LSM_REG_LAYOUT_CTRL2_G)
+        self.reg_ctrl3_c_bits    = struct(addressof(self._ctrl_shadow) + 2, LSM_REG_LAYOUT_CTRL3_C)
 
         # Create timer
         self.update_timer = Timer(-1)
@@ -61,16 +139,11 @@ class IMU():
         self.reset()
         
     def _default_config(self):
-        # Enable block data update
-        self._set_bdu()
+        # The reset changed the registers under the shadow
+        self._read_ctrl()
 
-        # Set default scale for each sensor
-        self.acc_scale('16g')
-        self.gyro_scale('2000dps')
-
-        # Set default rate for each sensor
-        self.acc_rate('208Hz')
-        self.gyro_rate('208Hz')
+        # Block data update, default scale and rate for each sensor, in one write
+        self.configure(acc_scale='16g', gyro_scale='2000dps', acc_rate='208Hz', gyro_rate='208Hz', bdu=True)
 
     """
         The following are private helper methods to read and write registers, as well as to convert the read values to the correct unit.
@@ -83,6 +156,34 @@ class IMU():
         # Sensor offsets
         self.gyro_offsets = [0,0,0]
         self.acc_offsets = [0,0,0]
+        self.calibration_temperature = None
+        # One of "none", "calibrated", "loaded", "checking", "verified" or "recalibrated"
+        self.calibration_status = "none"
+
+        # Stationary-window detector shared by the bias check and bias tracking, see
+        # _still_config(). _still_window == 0 means idle
+        self._still_window = 0
+        self._still_n = 0
+        self._still_gx = self._still_gy = self._still_gz = 0
+        self._still_ax = self._still_ay = self._still_az = 0
+        self._still_dx = self._still_dy = self._still_dz = 0
+        self._still_dx2 = self._still_dy2 = self._still_dz2 = 0
+        self._still_motion_q8 = 0
+        self._still_var_limit = 0
+        self._still_motors = None
+
+        # Background bias check after load_calibration(), see _start_bias_check()
+        self._checking = False
+        self._check_recalibrating = False
+        self._check_tolerance_q8 = 0
+
+        # Online bias tracking, see track_bias()
+        self._tracking = None
+        self._track_alpha = 0
+        self._track_stale_ms = 0
+        self.bias_updates = 0
+        self._bias_weight = 0.0
+        self._bias_updated_ms = 0
 
         # Scale factors when ranges are changed
         self._acc_scale_factor = 1
@@ -93,6 +194,30 @@ class IMU():
         self.running_yaw = 0
         self.running_roll = 0
 
+        # Gyro integrals since the last fold, in raw counts x nominal ticks, Q8.
+        # The angle is running_* + _int_* * _deg_per_count_q8
+        self._int_pitch = 0
+        self._int_roll = 0
+        self._int_yaw = 0
+
+        # Previous tick's time and offset-corrected gyro counts (Q8), for trapezoidal integration.
+        # _last_us < 0 means the next tick is the first since the timer started
+        self._last_us = -1
+        self._prev_gx = 0
+        self._prev_gy = 0
+        self._prev_gz = 0
+        self._dt_rem = 0
+        # Nominal timer period in us
+        self._tick_us = 1000000 // self.timer_frequency
+
+        # Combined scale/offset constants, see _update_constants()
+        self._mg_per_lsb = LSM_MG_PER_LSB_2G
+        self._mdps_per_lsb = LSM_MDPS_PER_LSB_125DPS
+        self._deg_per_count_q8 = 0
+        self._gx_offset_q8 = 0
+        self._gy_offset_q8 = 0
+        self._gz_offset_q8 = 0
+
     def _int16(self, d):
         return d if d < 0x8000 else d - 0x10000
 
@@ -117,27 +242,95 @@ class IMU():
         self.rb[0] = (self.rb[0] & mask) | dat
         self._setreg(reg, self.rb[0])
 
+    def _read_ctrl(self):
+        # Load the CTRL register shadow from the sensor, in one read
+        self.i2c.readfrom_mem_into(self.addr, LSM_REG_CTRL1_XL, self._ctrl_shadow)
+        self._ctrl_written[:] = self._ctrl_shadow
+
+    def _write_ctrl(self):
+        # Send the shadow bytes that differ from the sensor, as one write when the interface
+        # auto-increments
+        shadow = self._ctrl_shadow
+        written = self._ctrl_written
+        first = 0
+        while first < 3 and shadow[first] == written[first]:
+            first += 1
+        if first == 3:
+            return
+        last = 2
+        while shadow[last] == written[last]:
+            last -= 1
+        if written[2] & 0x04:
+            self.i2c.writeto_mem(self.addr, LSM_REG_CTRL1_XL + first, self._ctrl_mv[first:last + 1])
+        else:
+            # IF_INC was off on the sensor: one register per write
+            for i in range(first, last + 1):
+                self._setreg(LSM_REG_CTRL1_XL + i, shadow[i])
+        written[:] = shadow
+
     def _set_bdu(self, bdu = True):
         """
         Sets Block Data Update bit
         """
-        self.reg_ctrl3_c_byte[0] = self._getreg(LSM_REG_CTRL3_C)
         self.reg_ctrl3_c_bits.BDU = bdu
-        self._setreg(LSM_REG_CTRL3_C, self.reg_ctrl3_c_byte[0])
+        self._write_ctrl()
 
     def _set_if_inc(self, if_inc = True):
         """
         Sets InterFace INCrement bit
         """
-        self.reg_ctrl3_c_byte[0] = self._getreg(LSM_REG_CTRL3_C)
         self.reg_ctrl3_c_bits.IF_INC = if_inc
-        self._setreg(LSM_REG_CTRL3_C, self.reg_ctrl3_c_byte[0])
+        self._write_ctrl()
 
     def _raw_to_mg(self, raw):
         return self._int16((raw[1] << 8) | raw[0]) * LSM_MG_PER_LSB_2G * self._acc_scale_factor
 
     def _raw_to_mdps(self, raw):
         return self._int16((raw[1] << 8) | raw[0]) * LSM_MDPS_PER_LSB_125DPS * self._gyro_scale_factor
+
+    def _fold(self):
+        # Move the integer integrals into the float angles
+        state = disable_irq()
+        k = self._deg_per_count_q8
+        self.running_pitch += self._int_pitch * k
+        self.running_roll += self._int_roll * k
+        self.running_yaw += self._int_yaw * k
+        self._int_pitch = self._int_roll = self._int_yaw = 0
+        if self._hist_size:
+            self._new_epoch()
+        enable_irq(state)
+
+    def _new_epoch(self):
+        # Start an epoch at the current angles, unless no history entry uses the current one yet
+        if self._epoch_used:
+            self._epoch = (self._epoch + 1) % self._epoch_size
+            self._epoch_used = False
+        self._rebase()
+
+    def _rebase(self):
+        i = self._epoch * 3
+        self._epoch_base[i] = self.running_pitch
+        self._epoch_base[i + 1] = self.running_roll
+        self._epoch_base[i + 2] = self.running_yaw
+        self._epoch_k[self._epoch] = self._deg_per_count_q8
+
+    def _update_constants(self):
+        """
+        Recompute the combined scale and offset constants used by the update path.
+        Must be called after changing a scale, the gyro rate or the offsets.
+        """
+        # Integrals so far were accumulated with the old constants
+        self._fold()
+        self._mg_per_lsb = LSM_MG_PER_LSB_2G * self._acc_scale_factor
+        self._mdps_per_lsb = LSM_MDPS_PER_LSB_125DPS * self._gyro_scale_factor
+        # One raw count held for one nominal tick, in Q8, expressed in degrees
+        self._tick_us = 1000000 // self.timer_frequency
+        self._deg_per_count_q8 = self._mdps_per_lsb / 1000 * self._tick_us / 1000000 / 256
+        self._gx_offset_q8 = round(self.gyro_offsets[0] / self._mdps_per_lsb * 256)
+        self._gy_offset_q8 = round(self.gyro_offsets[1] / self._mdps_per_lsb * 256)
+        self._gz_offset_q8 = round(self.gyro_offsets[2] / self._mdps_per_lsb * 256)
+        if self._hist_size:
+            self._epoch_k[self._epoch] = self._deg_per_count_q8
     
     """
         Public facing API Methods
@@ -167,6 +360,12 @@ class IMU():
         # Stop timer
         self._stop_timer()
 
+        # The reset also clears the FIFO configuration
+        if self._fifo_pin is not None:
+            self._fifo_pin.irq(handler=None)
+            self._fifo_pin = None
+        self._fifo_active = False
+
         # Reset member variables
         self._reset_member_variables()
 
@@ -236,12 +435,13 @@ class IMU():
         :rtype: list<int>
         """
         # Burst read data registers
-        raw_bytes = self._getregs(LSM_REG_OUTX_L_A, 6)
+        self.i2c.readfrom_mem_into(self.addr, LSM_REG_OUTX_L_A, self._rates_buf)
+        x, y, z = ustruct.unpack_from('<hhh', self._rates_buf)
 
         # Convert raw data to mg's
-        self.irq_v[0][0] = self._raw_to_mg(raw_bytes[0:2]) - self.acc_offsets[0]
-        self.irq_v[0][1] = self._raw_to_mg(raw_bytes[2:4]) - self.acc_offsets[1]
-        self.irq_v[0][2] = self._raw_to_mg(raw_bytes[4:6]) - self.acc_offsets[2]
+        self.irq_v[0][0] = x * self._mg_per_lsb - self.acc_offsets[0]
+        self.irq_v[0][1] = y * self._mg_per_lsb - self.acc_offsets[1]
+        self.irq_v[0][2] = z * self._mg_per_lsb - self.acc_offsets[2]
 
         return self.irq_v[0]
 
@@ -281,12 +481,13 @@ class IMU():
             The order of the values is x, y, z.
         """
         # Burst read data registers
-        raw_bytes = self._getregs(LSM_REG_OUTX_L_G, 6)
+        self.i2c.readfrom_mem_into(self.addr, LSM_REG_OUTX_L_G, self._rates_buf)
+        x, y, z = ustruct.unpack_from('<hhh', self._rates_buf)
 
         # Convert raw data to mdps
-        self.irq_v[1][0] = self._raw_to_mdps(raw_bytes[0:2]) - self.gyro_offsets[0]
-        self.irq_v[1][1] = self._raw_to_mdps(raw_bytes[2:4]) - self.gyro_offsets[1]
-        self.irq_v[1][2] = self._raw_to_mdps(raw_bytes[4:6]) - self.gyro_offsets[2]
+        self.irq_v[1][0] = x * self._mdps_per_lsb - self.gyro_offsets[0]
+        self.irq_v[1][1] = y * self._mdps_per_lsb - self.gyro_offsets[1]
+        self.irq_v[1][2] = z * self._mdps_per_lsb - self.gyro_offsets[2]
 
         return self.irq_v[1]
 
@@ -297,15 +498,16 @@ class IMU():
             The order of the values is x, y, z.
         """
         # Burst read data registers
-        raw_bytes = self._getregs(LSM_REG_OUTX_L_G, 12)
+        self.i2c.readfrom_mem_into(self.addr, LSM_REG_OUTX_L_G, self._data_buf)
+        gx, gy, gz, ax, ay, az = ustruct.unpack_from('<hhhhhh', self._data_buf)
 
         # Convert raw data to mg's and mdps
-        self.irq_v[0][0] = self._raw_to_mg(raw_bytes[6:8]) - self.acc_offsets[0]
-        self.irq_v[0][1] = self._raw_to_mg(raw_bytes[8:10]) - self.acc_offsets[1]
-        self.irq_v[0][2] = self._raw_to_mg(raw_bytes[10:12]) - self.acc_offsets[2]
-        self.irq_v[1][0] = self._raw_to_mdps(raw_bytes[0:2]) - self.gyro_offsets[0]
-        self.irq_v[1][1] = self._raw_to_mdps(raw_bytes[2:4]) - self.gyro_offsets[1]
-        self.irq_v[1][2] = self._raw_to_mdps(raw_bytes[4:6]) - self.gyro_offsets[2]
+        self.irq_v[0][0] = ax * self._mg_per_lsb - self.acc_offsets[0]
+        self.irq_v[0][1] = ay * self._mg_per_lsb - self.acc_offsets[1]
+        self.irq_v[0][2] = az * self._mg_per_lsb - self.acc_offsets[2]
+        self.irq_v[1][0] = gx * self._mdps_per_lsb - self.gyro_offsets[0]
+        self.irq_v[1][1] = gy * self._mdps_per_lsb - self.gyro_offsets[1]
+        self.irq_v[1][2] = gz * self._mdps_per_lsb - self.gyro_offsets[2]
 
         return self.irq_v
     
@@ -316,7 +518,12 @@ class IMU():
         :return: The pitch of the IMU in degrees
         :rtype: float
         """
-        return self.running_pitch
+        if self._fusion is not None:
+            return self._fusion.pitch()
+        state = disable_irq()
+        pitch = self.running_pitch + self._int_pitch * self._deg_per_count_q8
+        enable_irq(state)
+        return pitch
     
     def get_yaw(self):
         """
@@ -325,7 +532,10 @@ class IMU():
         :return: The yaw (heading) of the IMU in degrees
         :rtype: float
         """
-        return self.running_yaw
+        state = disable_irq()
+        yaw = self.running_yaw + self._int_yaw * self._deg_per_count_q8
+        enable_irq(state)
+        return yaw
     
     def get_heading(self):
         """
@@ -334,7 +544,7 @@ class IMU():
         :return: The heading of the IMU in degrees, bound between [0, 360)
         :rtype: float
         """
-        return self.running_yaw % 360
+        return self.get_yaw() % 360
     
     def get_roll(self):
         """
@@ -343,25 +553,74 @@ class IMU():
         :return: The roll of the IMU in degrees
         :rtype: float
         """
-        return self.running_roll
+        if self._fusion is not None:
+            return self._fusion.roll()
+        state = disable_irq()
+        roll = self.running_roll + self._int_roll * self._deg_per_count_q8
+        enable_irq(state)
+        return roll
     
+    def get_quaternion(self):
+        """
+        Get the orientation estimated by the fusion filter
+
+        :return: Orientation as (w, x, y, z), or None if no fusion filter is set
+        :rtype: tuple
+        """
+        if self._fusion is None:
+            return None
+        return self._fusion.quaternion()
+
+    def set_fusion(self, fusion=None, decimation: int = 4):
+        """
+        Correct pitch and roll towards gravity using a ComplementaryFilter or MahonyFilter from
+        XRPLib.imu_fusion, so they stop drifting. Pass None to go back to pure gyro integration.
+        Yaw has no gravity reference and keeps using the gyro integrator.
+
+        The filter runs on the same burst sample as the gyro integration: the timer callback
+        sums raw samples and feeds the filter their mean every `decimation` ticks, which keeps
+        the float work out of most ticks (in FIFO mode it runs once per drain).
+
+        :param fusion: The filter to use, or None
+        :param decimation: Timer ticks per filter update
+        :type decimation: int
+        """
+        if fusion is not None:
+            fusion.reset(self.get_pitch(), self.get_roll(), self.get_yaw())
+        state = disable_irq()
+        self._fusion = fusion
+        self._fusion_decimation = decimation
+        self._fusion_count = 0
+        self._fusion_us = 0
+        self._fusion_gx = self._fusion_gy = self._fusion_gz = 0
+        self._fusion_ax = self._fusion_ay = self._fusion_az = 0
+        enable_irq(state)
+
+    def _run_fusion(self, gx_q8, gy_q8, gz_q8, ax, ay, az, samples, dt):
+        # gx_q8..: offset-corrected gyro sums in raw counts, Q8. ax..: accel sums in raw counts
+        k = self._mdps_per_lsb / 1000 / 256 / samples
+        mg = self._mg_per_lsb / samples
+        self._fusion.update(gx_q8 * k, gy_q8 * k, gz_q8 * k,
+                            ax * mg - self.acc_offsets[0], ay * mg - self.acc_offsets[1],
+                            az * mg - self.acc_offsets[2], dt)
+
     def reset_pitch(self):
         """
         Reset the pitch to 0
         """
-        self.running_pitch = 0
+        self.set_pitch(0)
 
     def reset_yaw(self):
         """
         Reset the yaw (heading) to 0
         """
-        self.running_yaw = 0
+        self.set_yaw(0)
     
     def reset_roll(self):
         """
         Reset the roll to 0
         """
-        self.running_roll = 0
+        self.set_roll(0)
 
     def set_pitch(self, pitch):
         """
@@ -370,7 +629,16 @@ class IMU():
         :param pitch: The pitch to set the IMU to
         :type pitch: float
         """
+        state = disable_irq()
+        if self._fusion is not None:
+            # get_pitch() reads the filter, so move its reference too
+            self._fusion.set_angles(pitch=pitch)
         self.running_pitch = pitch
+        self._int_pitch = 0
+        if self._hist_size:
+            # Entries so far are relative to the old angle
+            self._fold()
+        enable_irq(state)
 
     def set_yaw(self, yaw):
         """
@@ -379,7 +647,13 @@ class IMU():
         :param yaw: The yaw (heading) to set the IMU to
         :type yaw: float
         """
+        state = disable_irq()
         self.running_yaw = yaw
+        self._int_yaw = 0
+        if self._hist_size:
+            # Entries so far are relative to the old angle
+            self._fold()
+        enable_irq(state)
 
     def set_roll(self, roll):
         """
@@ -388,7 +662,16 @@ class IMU():
         :param roll: The roll to set the IMU to
         :type roll: float
         """
+        state = disable_irq()
+        if self._fusion is not None:
+            # get_roll() reads the filter, so move its reference too
+            self._fusion.set_angles(roll=roll)
         self.running_roll = roll
+        self._int_roll = 0
+        if self._hist_size:
+            # Entries so far are relative to the old angle
+            self._fold()
+        enable_irq(state)
 
     def temperature(self):
         """
@@ -417,19 +700,11 @@ class IMU():
         '2g', '4g', '8g', or '16g'
         Pass in no parameters to retrieve the current value
         """
-        # Get register value
-        self.reg_ctrl1_xl_byte[0] = self._getreg(LSM_REG_CTRL1_XL)
         #  Check if the provided value is in the dictionary
         if value not in LSM_ACCEL_FS:
-            # Return string representation of this value
-            index = list(LSM_ACCEL_FS.values()).index(self.reg_ctrl1_xl_bits.FS_XL)
-            return list(LSM_ACCEL_FS.keys())[index]
-        else:
-            # Set value as requested
-            self.reg_ctrl1_xl_bits.FS_XL = LSM_ACCEL_FS[value]
-            self._setreg(LSM_REG_CTRL1_XL, self.reg_ctrl1_xl_byte[0])
-            # Update scale factor for converting raw data
-            self._acc_scale_factor = int(value.rstrip('g')) // 2
+            # Return string representation of this value, from the shadow
+            return LSM_ACCEL_FS_NAMES[self.reg_ctrl1_xl_bits.FS_XL]
+        self.configure(acc_scale=value)
 
     def gyro_scale(self, value=None):
         """
@@ -437,19 +712,11 @@ class IMU():
         '125', '250', '500', '1000', or '2000'
         Pass in no parameters to retrieve the current value
         """
-        # Get register value
-        self.reg_ctrl2_g_byte[0] = self._getreg(LSM_REG_CTRL2_G)
         #  Check if the provided value is in the dictionary
         if value not in LSM_GYRO_FS:
-            # Return string representation of this value
-            index = list(LSM_GYRO_FS.values()).index(self.reg_ctrl2_g_bits.FS_G)
-            return list(LSM_GYRO_FS.keys())[index]
-        else:
-            # Set value as requested
-            self.reg_ctrl2_g_bits.FS_G = LSM_GYRO_FS[value]
-            self._setreg(LSM_REG_CTRL2_G, self.reg_ctrl2_g_byte[0])
-            # Update scale factor for converting raw data
-            self._gyro_scale_factor = int(value.rstrip('dps')) // 125
+            # Return string representation of this value, from the shadow
+            return LSM_GYRO_FS_NAMES[self.reg_ctrl2_g_bits.FS_G]
+        self.configure(gyro_scale=value)
 
     def acc_rate(self, value=None):
         """
@@ -457,17 +724,11 @@ class IMU():
         '0Hz', '12.5Hz', '26Hz', '52Hz', '104Hz', '208Hz', '416Hz', '833Hz', '1660Hz', '3330Hz', '6660Hz'
         Pass in no parameters to retrieve the current value
         """
-        # Get register value
-        self.reg_ctrl1_xl_byte[0] = self._getreg(LSM_REG_CTRL1_XL)
         #  Check if the provided value is in the dictionary
         if value not in LSM_ODR:
-            # Return string representation of this value
-            index = list(LSM_ODR.values()).index(self.reg_ctrl1_xl_bits.ODR_XL)
-            return list(LSM_ODR.keys())[index]
-        else:
-            # Set value as requested
-            self.reg_ctrl1_xl_bits.ODR_XL = LSM_ODR[value]
-            self._setreg(LSM_REG_CTRL1_XL, self.reg_ctrl1_xl_byte[0])
+            # Return string representation of this value, from the shadow
+            return LSM_ODR_NAMES[self.reg_ctrl1_xl_bits.ODR_XL]
+        self.configure(acc_rate=value)
 
     def gyro_rate(self, value=None):
         """
@@ -475,20 +736,56 @@ class IMU():
         '0Hz', '12.5Hz', '26Hz', '52Hz', '104Hz', '208Hz', '416Hz', '833Hz', '1660Hz', '3330Hz', '6660Hz'
         Pass in no parameters to retrieve the current value
         """
-        # Get register value
-        self.reg_ctrl2_g_byte[0] = self._getreg(LSM_REG_CTRL2_G)
         #  Check if the provided value is in the dictionary
         if value not in LSM_ODR:
-            # Return string representation of this value
-            index = list(LSM_ODR.values()).index(self.reg_ctrl1_xl_bits.ODR_G)
-            return list(LSM_ODR.keys())[index]
-        else:
-            # Set value as requested
-            self.reg_ctrl2_g_bits.ODR_G = LSM_ODR[value]
-            self._setreg(LSM_REG_CTRL2_G, self.reg_ctrl2_g_byte[0])
+            # Return string representation of this value, from the shadow
+            return LSM_ODR_NAMES[self.reg_ctrl2_g_bits.ODR_G]
+        self.configure(gyro_rate=value)
 
+    def configure(self, acc_scale=None, gyro_scale=None, acc_rate=None, gyro_rate=None, bdu=None):
+        """
+        Change several settings with a single register write. Settings left as None are kept.
+        Takes the same values as acc_scale(), gyro_scale(), acc_rate() and gyro_rate()
+
+        :param acc_scale: Accelerometer scale, e.g. '16g'
+        :type acc_scale: str
+        :param gyro_scale: Gyroscope scale, e.g. '2000dps'
+        :type gyro_scale: str
+        :param acc_rate: Accelerometer rate, e.g. '208Hz'
+        :type acc_rate: str
+        :param gyro_rate: Gyroscope rate, e.g. '208Hz'. Also sets the update timer's frequency
+        :type gyro_rate: str
+        :param bdu: Block data update
+        :type bdu: bool
+        """
+        if ((acc_scale is not None and acc_scale not in LSM_ACCEL_FS) or
+                (gyro_scale is not None and gyro_scale not in LSM_GYRO_FS) or
+                (acc_rate is not None and acc_rate not in LSM_ODR) or
+                (gyro_rate is not None and gyro_rate not in LSM_ODR)):
+            raise ValueError("Invalid IMU setting")
+        if acc_scale is not None:
+            self.reg_ctrl1_xl_bits.FS_XL = LSM_ACCEL_FS[acc_scale]
+        if acc_rate is not None:
+            self.reg_ctrl1_xl_bits.ODR_XL = LSM_ODR[acc_rate]
+        if gyro_scale is not None:
+            self.reg_ctrl2_g_bits.FS_G = LSM_GYRO_FS[gyro_scale]
+        if gyro_rate is not None:
+            self.reg_ctrl2_g_bits.ODR_G = LSM_ODR[gyro_rate]
+        if bdu is not None:
+            self.reg_ctrl3_c_bits.BDU = bdu
+        self._write_ctrl()
+
+        # Update scale factors for converting raw data
+        if acc_scale is not None:
+            self._acc_scale_factor = int(acc_scale.rstrip('g')) // 2
+        if gyro_scale is not None:
+            self._gyro_scale_factor = int(gyro_scale.rstrip('dps')) // 125
+        if gyro_rate is not None:
             # Update timer frequency
-            self.timer_frequency = int(value.rstrip('Hz'))
+            self.timer_frequency = int(gyro_rate.rstrip('Hz'))
+        if acc_scale is not None or gyro_scale is not None or gyro_rate is not None:
+            self._update_constants()
+        if gyro_rate is not None:
             self._start_timer()
 
     def calibrate(self, calibration_time:float=1, vertical_axis:int= 2):
@@ -503,8 +800,11 @@ class IMU():
         :type vertical_axis: int
         """
         self._stop_timer()
+        self._checking = False
+        self._still_window = 0
         self.acc_offsets = [0,0,0]
         self.gyro_offsets = [0,0,0]
+        self._update_constants()
         avg_vals = [[0,0,0],[0,0,0]]
         num_vals = 0
         # Wait a bit for sensor to start measuring (data registers may default to something nonsensical)
@@ -536,23 +836,717 @@ class IMU():
 
         self.acc_offsets = avg_vals[0]
         self.gyro_offsets = avg_vals[1]
+        self.calibration_temperature = self.temperature()
+        self.calibration_status = "calibrated"
+        self._bias_weight = 1.0
+        self._bias_updated_ms = time.ticks_ms()
+        self._update_constants()
+        if self._tracking is not None:
+            self._still_config(*self._tracking)
         self._start_timer()
 
+    def save_calibration(self):
+        """
+        Save the offsets from calibrate(), with the temperature, scales and rate they were taken at,
+        to calibration_file on flash so the next boot can skip calibrating
+        """
+        calibration = {
+            "version": _CALIBRATION_VERSION,
+            "gyro_offsets": list(self.gyro_offsets),
+            "acc_offsets": list(self.acc_offsets),
+            "temperature": self.calibration_temperature,
+            "acc_scale": self.acc_scale(),
+            "gyro_scale": self.gyro_scale(),
+            "rate": self.timer_frequency,
+        }
+        with open(self.calibration_file, "w") as f:
+            json.dump(calibration, f)
+
+    def load_calibration(self, max_temperature_drift: float = 10, check: bool = True):
+        """
+        Load the offsets saved by save_calibration(). They are only used if they were taken at the
+        current scales and rate, and within max_temperature_drift of the current temperature, since
+        gyro bias moves with temperature.
+
+        The robot can move as soon as this returns. With check, the first stretch of samples in
+        which the robot is still is used to verify the gyro offsets in the background; if they
+        are off, the gyro is recalibrated from the next second of stillness and the file is updated.
+        Follow progress in calibration_status.
+
+        :param max_temperature_drift: Largest temperature change in degrees Celsius since calibration
+        :type max_temperature_drift: float
+        :param check: Verify the gyro offsets in the background
+        :type check: bool
+        :return: True if the saved calibration was loaded, False if calibrate() is needed
+        :rtype: bool
+        """
+        try:
+            with open(self.calibration_file) as f:
+                calibration = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if (calibration.get("version") != _CALIBRATION_VERSION
+                or calibration.get("acc_scale") != self.acc_scale()
+                or calibration.get("gyro_scale") != self.gyro_scale()
+                or calibration.get("rate") != self.timer_frequency):
+            return False
+        temperature = calibration.get("temperature")
+        # Right after a reset OUT_TEMP still holds its 25 C default, so compare a fresh sample
+        if temperature is None or not self._wait_temperature():
+            return False
+        if abs(self.temperature() - temperature) > max_temperature_drift:
+            return False
+
+        self.gyro_offsets = calibration["gyro_offsets"]
+        self.acc_offsets = calibration["acc_offsets"]
+        self.calibration_temperature = temperature
+        self.calibration_status = "loaded"
+        self._update_constants()
+        if check:
+            self._start_bias_check()
+        return True
+
+    def _wait_temperature(self, timeout_ms: int = 100):
+        # Wait for the sensor to flag a new temperature sample (52Hz while measuring)
+        t0 = time.ticks_ms()
+        while time.ticks_diff(time.ticks_ms(), t0) < timeout_ms:
+            if self._getreg(LSM_REG_STATUS) & LSM_STATUS_TDA:
+                return True
+            time.sleep_ms(1)
+        return False
+
+    def _start_bias_check(self, window_s: float = 0.25, tolerance_dps: float = 0.3,
+                          motion_dps: float = 5, still_mg: float = 30):
+        # Average the offset-corrected gyro over window_s of stillness, in the update timer
+        self._bias_weight = 0.5
+        self._bias_updated_ms = time.ticks_ms()
+        state = disable_irq()
+        self._check_tolerance_q8 = int(tolerance_dps * 256 * 1000 / self._mdps_per_lsb)
+        self._check_recalibrating = False
+        self._checking = True
+        self.calibration_status = "checking"
+        self._still_config(window_s, motion_dps, still_mg)
+        enable_irq(state)
+
+    def track_bias(self, enabled: bool = True, motors=None, alpha: float = 0.125, window_s: float = 0.5,
+                   motion_dps: float = 3, still_mg: float = 4, stale_s: float = 120):
+        """
+        Keep estimating the gyro bias while the robot runs. The LSM6DSO's bias drifts with
+        temperature, so offsets from a calibration at boot slowly stop matching over a long
+        session and the yaw drifts.
+
+        The update timer looks for stationary windows: window_s in which no gyro axis exceeds
+        motion_dps, the accelerometer's standard deviation stays under still_mg on every axis,
+        and (if motors are given) every motor's encoder speed is zero. The mean gyro rate over
+        such a window is what is left of the bias, and gyro_offsets moves alpha of the way
+        towards it. Nothing is updated while the robot moves.
+
+        Off by default, since it adds work to the update timer. To enable it from main code:
+
+            from XRPLib.defaults import *
+            imu.track_bias(motors=[left_motor, right_motor])
+
+        :param enabled: Start tracking, or stop it with False
+        :type enabled: bool
+        :param motors: EncodedMotors that must be still, e.g. [left_motor, right_motor]
+        :type motors: list
+        :param alpha: Weight of each stationary window in the estimate
+        :type alpha: float
+        :param window_s: Length of a stationary window in seconds
+        :type window_s: float
+        :param motion_dps: Gyro rate on any axis that counts as moving
+        :type motion_dps: float
+        :param still_mg: Accelerometer standard deviation on any axis that counts as moving
+        :type still_mg: float
+        :param stale_s: Time without a stationary window over which get_bias_confidence() halves
+        :type stale_s: float
+        """
+        state = disable_irq()
+        if not enabled:
+            self._tracking = None
+            if not self._checking:
+                self._still_window = 0
+            enable_irq(state)
+            return
+        self._tracking = (window_s, motion_dps, still_mg)
+        self._track_alpha = alpha
+        self._track_stale_ms = int(stale_s * 1000)
+        self._still_motors = motors
+        if not self._checking:
+            self._still_config(window_s, motion_dps, still_mg)
+        enable_irq(state)
+
+    def get_gyro_bias(self):
+        """
+        Get the gyro bias currently subtracted from every reading
+
+        :return: The bias on x, y and z in mdps
+        :rtype: list
+        """
+        return list(self.gyro_offsets)
+
+    def get_bias_confidence(self):
+        """
+        Get how much the current gyro bias can be trusted, from 0 to 1. 1 right after calibrate()
+        or a verified load_calibration(), lower for an unverified load, rising as track_bias()
+        confirms the estimate, and halving every stale_s without a stationary window.
+
+        :return: The confidence in the gyro bias
+        :rtype: float
+        """
+        if self._bias_weight == 0:
+            return 0.0
+        stale_ms = self._track_stale_ms or 120000
+        age = time.ticks_diff(time.ticks_ms(), self._bias_updated_ms)
+        return self._bias_weight * 0.5 ** (age / stale_ms)
+
+    def _still_config(self, window_s, motion_dps, still_mg):
+        # Start looking for stationary windows of window_s
+        still_counts = still_mg / self._mg_per_lsb
+        self._still_motion_q8 = int(motion_dps * 256 * 1000 / self._mdps_per_lsb)
+        self._still_var_limit = int(still_counts * still_counts) + 1
+        self._still_n = 0
+        self._still_window = max(2, int(window_s * self.timer_frequency))
+
+    def _still_sample(self, gx, gy, gz, data):
+        # Called from the update timer while _still_window is set. gx..: offset-corrected gyro
+        # counts, Q8. Small-int math only; the window ends in _on_still_window()
+        limit = self._still_motion_q8
+        if gx > limit or gx < -limit or gy > limit or gy < -limit or gz > limit or gz < -limit:
+            self._still_n = 0
+            return
+        ax = data.AX
+        ay = data.AY
+        az = data.AZ
+        if self._still_n == 0:
+            self._still_gx = self._still_gy = self._still_gz = 0
+            self._still_dx = self._still_dy = self._still_dz = 0
+            self._still_dx2 = self._still_dy2 = self._still_dz2 = 0
+            self._still_ax = ax
+            self._still_ay = ay
+            self._still_az = az
+        self._still_gx += gx
+        self._still_gy += gy
+        self._still_gz += gz
+        # Accelerometer deviation from the window's first sample, clamped so squares stay small ints
+        dx = max(-1024, min(1024, ax - self._still_ax))
+        dy = max(-1024, min(1024, ay - self._still_ay))
+        dz = max(-1024, min(1024, az - self._still_az))
+        self._still_dx += dx
+        self._still_dy += dy
+        self._still_dz += dz
+        self._still_dx2 += dx * dx
+        self._still_dy2 += dy * dy
+        self._still_dz2 += dz * dz
+        self._still_n += 1
+        if self._still_n < self._still_window:
+            return
+
+        n = self._still_n
+        self._still_n = 0
+        # n^2 x variance, compared without dividing
+        limit = self._still_var_limit * n * n
+        if (self._still_dx2 * n - self._still_dx * self._still_dx > limit or
+                self._still_dy2 * n - self._still_dy * self._still_dy > limit or
+                self._still_dz2 * n - self._still_dz * self._still_dz > limit):
+            return
+        motors = self._still_motors
+        if motors is not None:
+            for motor in motors:
+                if motor.speed != 0:
+                    return
+        self._on_still_window(self._still_gx // n, self._still_gy // n, self._still_gz // n)
+
+    def _on_still_window(self, bias_x, bias_y, bias_z):
+        # bias_*: mean offset-corrected gyro over a stationary window, counts Q8
+        k = self._mdps_per_lsb / 256
+        if self._checking:
+            tolerance = self._check_tolerance_q8
+            if self._check_recalibrating:
+                # A calibration's worth of stillness: the mean is the remaining gyro bias
+                self.gyro_offsets = [self.gyro_offsets[0] + bias_x * k,
+                                     self.gyro_offsets[1] + bias_y * k,
+                                     self.gyro_offsets[2] + bias_z * k]
+                self.calibration_temperature = self.temperature()
+                self.calibration_status = "recalibrated"
+                self._update_constants()
+                schedule(lambda _: self.save_calibration(), 0)
+            elif (bias_x > tolerance or bias_x < -tolerance or bias_y > tolerance or bias_y < -tolerance or
+                    bias_z > tolerance or bias_z < -tolerance):
+                # Saved offsets no longer match: recalibrate the gyro over one second of stillness
+                self._check_recalibrating = True
+                self._still_window = self.timer_frequency
+                return
+            else:
+                self.calibration_status = "verified"
+            self._checking = False
+            self._bias_weight = 1.0
+            self._bias_updated_ms = time.ticks_ms()
+            if self._tracking is not None:
+                self._still_config(*self._tracking)
+            else:
+                self._still_window = 0
+            return
+
+        # Bias tracking: exponentially weighted update of the offsets
+        alpha = self._track_alpha
+        self.gyro_offsets = [self.gyro_offsets[0] + alpha * bias_x * k,
+                             self.gyro_offsets[1] + alpha * bias_y * k,
+                             self.gyro_offsets[2] + alpha * bias_z * k]
+        self._update_constants()
+        self.bias_updates += 1
+        self._bias_weight += alpha * (1 - self._bias_weight)
+        self._bias_updated_ms = time.ticks_ms()
+
+    def start_fifo(self, rate: str = '833Hz', drain_ms: int = 20, int1_pin=None):
+        """
+        Stream gyro and accelerometer samples through the LSM6DSO's on-chip FIFO instead of
+        reading every sample. The FIFO batches each sample with a sensor timestamp, and is
+        drained in one burst read every drain_ms (from the update timer) or whenever it
+        reaches the watermark (from INT1). Every gyro sample is integrated with the sample
+        period measured from those timestamps, so high rates like 833Hz or 1660Hz cost one
+        wake-up per batch instead of one per sample.
+
+        :param rate: Gyro and accelerometer output data rate, one of the LSM_ODR keys
+        :type rate: str
+        :param drain_ms: Time between drains, which sets the watermark
+        :type drain_ms: int
+        :param int1_pin: Pin wired to the IMU's INT1, to drain on the watermark interrupt
+            instead of a timer
+        """
+        if rate not in LSM_ODR or rate == '0Hz':
+            raise ValueError("Invalid FIFO rate")
+        if self._fifo_active:
+            self.stop_fifo()
+        self._fifo_prev_frequency = self.timer_frequency
+
+        # Set both data rates; gyro_rate restarts the update timer, which the FIFO replaces
+        self.acc_rate(rate)
+        self.gyro_rate(rate)
+        self._stop_timer()
+        self._fold()
+
+        # Gyro, accel and timestamp word per sample; keep a quarter of the FIFO spare
+        odr = LSM_ODR[rate]
+        words = min(3 * (self.timer_frequency * drain_ms // 1000 + 1), LSM_FIFO_MAX_WORDS * 3 // 4)
+        if self._fifo_buf is None:
+            self._fifo_buf = bytearray(LSM_FIFO_MAX_WORDS * LSM_FIFO_WORD_SIZE)
+            self._fifo_mv = memoryview(self._fifo_buf)
+        self._fifo_last_ts = -1
+
+        self._setreg(LSM_REG_FIFO_CTRL4, LSM_FIFO_MODE_BYPASS)  # Flushes the FIFO
+        self._setreg(LSM_REG_FIFO_CTRL1, words & 0xFF)
+        self._setreg(LSM_REG_FIFO_CTRL2, (words >> 8) & 0x01)
+        self._setreg(LSM_REG_FIFO_CTRL3, (odr << 4) | odr)
+        self._r_w_reg(LSM_REG_CTRL10_C, LSM_CTRL10_TIMESTAMP_EN, 0xFF)
+        self._setreg(LSM_REG_FIFO_CTRL4, LSM_FIFO_DEC_TS_BATCH_1 | LSM_FIFO_MODE_CONTINUOUS)
+        self._fifo_active = True
+
+        if int1_pin is None:
+            self.update_timer.init(period=drain_ms, callback=lambda t: self._drain_fifo())
+        else:
+            self._r_w_reg(LSM_REG_INT1_CTRL, LSM_INT1_FIFO_TH, 0xFF)
+            self._fifo_pin = Pin(int1_pin, Pin.IN)
+            self._fifo_pin.irq(trigger=Pin.IRQ_RISING, handler=lambda p: self._drain_fifo())
+
+    def stop_fifo(self):
+        """
+        Stop FIFO streaming and go back to reading every sample from the update timer,
+        at the rate used before start_fifo().
+        """
+        if not self._fifo_active:
+            return
+        if self._fifo_pin is not None:
+            self._fifo_pin.irq(handler=None)
+            self._fifo_pin = None
+            self._r_w_reg(LSM_REG_INT1_CTRL, 0, ~LSM_INT1_FIFO_TH & 0xFF)
+        self._stop_timer()
+        self._drain_fifo()
+        self._setreg(LSM_REG_FIFO_CTRL4, LSM_FIFO_MODE_BYPASS)
+        self._fifo_active = False
+        rate = f"{self._fifo_prev_frequency}Hz"
+        self.acc_rate(rate)
+        self.gyro_rate(rate)
+
+    def fifo_stats(self):
+        """
+        :return: FIFO drains, samples integrated, overruns and the measured sample period in us
+        :rtype: dict
+        """
+        return {
+            "drains": self.fifo_drains,
+            "samples": self.fifo_samples,
+            "overruns": self.fifo_overruns,
+            "period_us": self.fifo_period_us,
+        }
+
+    def _drain_fifo(self):
+        # Called from the update timer or INT1. Two reads: FIFO level, then every queued word
+        status = self._fifo_status
+        self.i2c.readfrom_mem_into(self.addr, LSM_REG_FIFO_STATUS1, status)
+        words = status[0] | ((status[1] & 0x03) << 8)
+        if status[1] & LSM_FIFO_STATUS2_OVR:
+            self.fifo_overruns += 1
+        if words == 0:
+            return
+        if words > LSM_FIFO_MAX_WORDS:
+            words = LSM_FIFO_MAX_WORDS
+        n = words * LSM_FIFO_WORD_SIZE
+        # The output address wraps from the last data byte back to the tag, so one read gets every word
+        self.i2c.readfrom_mem_into(self.addr, LSM_REG_FIFO_DATA_OUT_TAG, self._fifo_mv[:n])
+
+        buf = self._fifo_buf
+        data = self._data_buf
+        gx_off = self._gx_offset_q8
+        gy_off = self._gy_offset_q8
+        gz_off = self._gz_offset_q8
+        sum_p = sum_r = sum_y = 0
+        pending_p = pending_r = pending_y = 0
+        samples = 0
+        first_ts = last_ts = -1
+        ts_words = 0
+        for i in range(0, n, LSM_FIFO_WORD_SIZE):
+            tag = buf[i] >> 3
+            if tag == LSM_FIFO_TAG_GYRO:
+                sum_p += (_s16(buf[i + 1], buf[i + 2]) << 8) - gx_off
+                sum_r += (_s16(buf[i + 3], buf[i + 4]) << 8) - gy_off
+                sum_y += (_s16(buf[i + 5], buf[i + 6]) << 8) - gz_off
+                samples += 1
+                if (sum_p > _FOLD_LIMIT or sum_p < -_FOLD_LIMIT or sum_r > _FOLD_LIMIT or
+                        sum_r < -_FOLD_LIMIT or sum_y > _FOLD_LIMIT or sum_y < -_FOLD_LIMIT):
+                    # Keep the sums in small-int range
+                    pending_p += sum_p
+                    pending_r += sum_r
+                    pending_y += sum_y
+                    sum_p = sum_r = sum_y = 0
+                for k in range(6):
+                    data[k] = buf[i + 1 + k]
+            elif tag == LSM_FIFO_TAG_ACCEL:
+                for k in range(6):
+                    data[6 + k] = buf[i + 1 + k]
+            elif tag == LSM_FIFO_TAG_TIMESTAMP:
+                # Low 24 bits of the 25us timestamp, enough for 419 s and always a small int
+                last_ts = buf[i + 1] | (buf[i + 2] << 8) | (buf[i + 3] << 16)
+                if first_ts < 0:
+                    first_ts = last_ts
+                ts_words += 1
+
+        # Sample period from the sensor's own timestamps: across drains when the previous
+        # one is known, otherwise within this drain, otherwise nominal
+        period_ticks = 0
+        if last_ts >= 0 and self._fifo_last_ts >= 0 and ts_words:
+            period_ticks = ((last_ts - self._fifo_last_ts) & 0xFFFFFF) / ts_words
+        elif ts_words > 1:
+            period_ticks = ((last_ts - first_ts) & 0xFFFFFF) / (ts_words - 1)
+        if last_ts >= 0:
+            self._fifo_last_ts = last_ts
+        if period_ticks:
+            period_s = period_ticks * LSM_TIMESTAMP_US_PER_LSB / 1000000
+        else:
+            period_s = 1 / self.timer_frequency
+        self.fifo_period_us = period_s * 1000000
+
+        k = self._mdps_per_lsb / 1000 / 256 * period_s
+        state = disable_irq()
+        self.running_pitch += (pending_p + sum_p) * k
+        self.running_roll += (pending_r + sum_r) * k
+        self.running_yaw += (pending_y + sum_y) * k
+        if self._hist_size:
+            self._new_epoch()
+            self._record(time.ticks_us())
+        enable_irq(state)
+        self.fifo_drains += 1
+        self.fifo_samples += samples
+
+        if self._fusion is not None and samples:
+            # One filter update per drain, from the mean gyro rate and the newest accel sample
+            self._run_fusion(pending_p + sum_p, pending_r + sum_r, pending_y + sum_y,
+                             _s16(data[6], data[7]), _s16(data[8], data[9]), _s16(data[10], data[11]),
+                             samples, samples * period_s)
+
+    def start_history(self, size: int = 128):
+        """
+        Keep the last size IMU states in a preallocated ring buffer, filled by the update callback
+        without allocating. Each entry holds the ticks_us of its sample, yaw, pitch and roll, and
+        the gyro rates. Pitch and roll are the gyro-integrated angles, also with a fusion filter set.
+        In FIFO mode there is one entry per drain.
+
+        :param size: Number of states kept (at least 2); at 208Hz, 128 covers 0.6 s
+        :type size: int
+        """
+        if size < 2:
+            raise ValueError("size must be at least 2")
+        ticks = array('I', bytes(4 * size))
+        integrals = array('i', bytes(12 * size))
+        raw = array('h', bytes(6 * size))
+        epochs = array('H', bytes(2 * size))
+        # Live entries reference at most size epochs, plus the current one
+        epoch_size = size + 2
+        epoch_base = array('f', bytes(12 * epoch_size))
+        epoch_k = array('f', bytes(4 * epoch_size))
+        state = disable_irq()
+        self._hist_ticks = ticks
+        self._hist_int = integrals
+        self._hist_raw = raw
+        self._hist_epoch = epochs
+        self._epoch_base = epoch_base
+        self._epoch_k = epoch_k
+        self._epoch_size = epoch_size
+        self._epoch = 0
+        self._epoch_used = False
+        self._hist_next = 0
+        self._hist_count = 0
+        self._hist_size = size
+        self._rebase()
+        enable_irq(state)
+
+    def stop_history(self):
+        """
+        Stop recording states and free the history buffer
+        """
+        state = disable_irq()
+        self._hist_size = 0
+        self._hist_count = 0
+        self._hist_ticks = self._hist_int = self._hist_raw = self._hist_epoch = None
+        self._epoch_base = self._epoch_k = None
+        enable_irq(state)
+
+    def _record(self, now):
+        # Called from the update callback. Small-int stores into preallocated arrays only
+        i = self._hist_next
+        j = i * 3
+        data = self._data
+        self._hist_ticks[i] = now
+        self._hist_int[j] = self._int_pitch
+        self._hist_int[j + 1] = self._int_roll
+        self._hist_int[j + 2] = self._int_yaw
+        self._hist_raw[j] = data.GX
+        self._hist_raw[j + 1] = data.GY
+        self._hist_raw[j + 2] = data.GZ
+        self._hist_epoch[i] = self._epoch
+        self._epoch_used = True
+        i += 1
+        self._hist_next = 0 if i == self._hist_size else i
+        if self._hist_count < self._hist_size:
+            self._hist_count += 1
+
+    def _hist_index(self, k):
+        # Ring index of the k-th oldest entry
+        return (self._hist_next - self._hist_count + k) % self._hist_size
+
+    def _hist_angle(self, i, axis):
+        # axis: 0 pitch, 1 roll, 2 yaw
+        e = self._hist_epoch[i]
+        return self._epoch_base[e * 3 + axis] + self._hist_int[i * 3 + axis] * self._epoch_k[e]
+
+    def _hist_entry(self, i):
+        k = self._mdps_per_lsb / 1000
+        j = i * 3
+        return (self._hist_ticks[i], self._hist_angle(i, 2), self._hist_angle(i, 0), self._hist_angle(i, 1),
+                self._hist_raw[j] * k - self.gyro_offsets[0] / 1000,
+                self._hist_raw[j + 1] * k - self.gyro_offsets[1] / 1000,
+                self._hist_raw[j + 2] * k - self.gyro_offsets[2] / 1000)
+
+    def latest_state(self):
+        """
+        Get the most recent state in the history buffer, without touching the bus
+
+        :return: (ticks_us, yaw, pitch, roll, x rate, y rate, z rate) in degrees and degrees per second,
+            or None if there is no entry yet
+        :rtype: tuple
+        """
+        state = disable_irq()
+        entry = self._hist_entry((self._hist_next - 1) % self._hist_size) if self._hist_count else None
+        enable_irq(state)
+        return entry
+
+    def history(self, count: int = None):
+        """
+        Get the buffered states, oldest first, for logging
+
+        :param count: Number of most recent states to return (default all buffered)
+        :type count: int
+        :return: List of (ticks_us, yaw, pitch, roll, x rate, y rate, z rate) tuples
+        :rtype: list
+        """
+        state = disable_irq()
+        available = self._hist_count
+        if count is None or count > available:
+            count = available
+        first = available - count
+        entries = [self._hist_entry(self._hist_index(first + k)) for k in range(count)]
+        enable_irq(state)
+        return entries
+
+    def yaw_at(self, ticks_us: int):
+        """
+        Get the yaw at a past time, interpolated between the buffered states around it. Use it to
+        line up the heading with a measurement taken at ticks_us, e.g. by another sensor.
+
+        :param ticks_us: time.ticks_us() value of the moment to look up
+        :type ticks_us: int
+        :return: Yaw in degrees; the latest yaw for times after the newest state, or None for times
+            before the oldest one or an empty buffer
+        :rtype: float
+        """
+        state = disable_irq()
+        count = self._hist_count
+        if count == 0:
+            enable_irq(state)
+            return None
+        ticks = self._hist_ticks
+        newest = self._hist_index(count - 1)
+        if time.ticks_diff(ticks_us, ticks[newest]) >= 0:
+            yaw = self._hist_angle(newest, 2)
+            enable_irq(state)
+            return yaw
+        if time.ticks_diff(ticks_us, ticks[self._hist_index(0)]) < 0:
+            enable_irq(state)
+            return None
+        # Binary search for the last entry at or before ticks_us
+        lo = 0
+        hi = count - 1
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if time.ticks_diff(ticks_us, ticks[self._hist_index(mid)]) >= 0:
+                lo = mid
+            else:
+                hi = mid
+        a = self._hist_index(lo)
+        b = self._hist_index(hi)
+        span = time.ticks_diff(ticks[b], ticks[a])
+        yaw_a = self._hist_angle(a, 2)
+        yaw_b = self._hist_angle(b, 2)
+        enable_irq(state)
+        if span <= 0:
+            return yaw_b
+        return yaw_a + (yaw_b - yaw_a) * time.ticks_diff(ticks_us, ticks[a]) / span
+
+    def integration_stats(self):
+        """
+        Timing of the update timer as seen by the gyro integrator. Virtual timer callbacks are
+        delayed by GC, WiFi and other interrupts; each tick integrates over the measured time
+        since the previous one, so a late or missed tick does not lose heading.
+
+        :return: Ticks, mean and max time between ticks in us, the nominal period in us, and
+            samples missed (gaps of 1.5 nominal periods or more, counted in whole periods)
+        :rtype: dict
+        """
+        state = disable_irq()
+        ticks = self.ticks
+        intervals = self._dt_count
+        total = self._dt_total_us + self._dt_sum_us
+        enable_irq(state)
+        return {
+            "ticks": ticks,
+            "mean_dt_us": total / intervals if intervals else 0,
+            "max_dt_us": self.max_dt_us,
+            "nominal_dt_us": self._tick_us,
+            "missed": self.missed_samples,
+        }
+
+    def reset_integration_stats(self):
+        """
+        Clear the counters reported by integration_stats()
+        """
+        state = disable_irq()
+        self.ticks = 0
+        self.missed_samples = 0
+        self.max_dt_us = 0
+        self._dt_count = 0
+        self._dt_sum_us = 0
+        self._dt_total_us = 0.0
+        enable_irq(state)
+
     def _start_timer(self):
+        self._last_us = -1
         self.update_timer.init(freq=self.timer_frequency, callback=lambda t:self._update_imu_readings())
 
     def _stop_timer(self):
         self.update_timer.deinit()
 
     def _update_imu_readings(self):
-        # Called every tick through a callback timer
-        self.get_gyro_rates()
-        delta_pitch = self.irq_v[1][0] / 1000 / self.timer_frequency
-        delta_roll = self.irq_v[1][1] / 1000 / self.timer_frequency
-        delta_yaw = self.irq_v[1][2] / 1000 / self.timer_frequency
-
+        # Called every tick through a callback timer. Allocation free: one burst read into a
+        # preallocated buffer, read back through the uctypes view, and small-int math only.
+        # (ustruct.unpack_from would allocate a result tuple every tick.)
+        now = time.ticks_us()
+        self.i2c.readfrom_mem_into(self.addr, LSM_REG_OUTX_L_G, self._data_buf)
+        data = self._data
+        gx = (data.GX << 8) - self._gx_offset_q8
+        gy = (data.GY << 8) - self._gy_offset_q8
+        gz = (data.GZ << 8) - self._gz_offset_q8
+
+        # Time since the previous tick in nominal periods, Q6
+        last = self._last_us
+        self._last_us = now
+        self.ticks += 1
+        if last < 0:
+            dt = self._tick_us
+            dt_q6 = 64
+            self._prev_gx = gx
+            self._prev_gy = gy
+            self._prev_gz = gz
+        else:
+            dt = time.ticks_diff(now, last)
+            # The remainder of the Q6 division carries over to the next tick, so rounding
+            # does not bias the total time integrated
+            scaled = (dt << 6) + self._dt_rem
+            dt_q6 = scaled // self._tick_us
+            self._dt_rem = scaled - dt_q6 * self._tick_us
+            self._dt_count += 1
+            self._dt_sum_us += dt
+            if dt > self.max_dt_us:
+                self.max_dt_us = dt
+            if dt_q6 >= 96:
+                # Late by half a period or more: the timer skipped ticks. The trapezoid below
+                # spans the whole gap, so the missed samples are interpolated, not lost
+                self.missed_samples += ((dt_q6 + 32) >> 6) - 1
+
+        # Trapezoid between the previous and this sample. Whole periods and the Q6 fraction are
+        # applied separately so each product stays a small int
+        whole = dt_q6 >> 6
+        frac = dt_q6 & 63
+        avg_p = (self._prev_gx + gx) >> 1
+        avg_r = (self._prev_gy + gy) >> 1
+        avg_y = (self._prev_gz + gz) >> 1
         state = disable_irq()
-        self.running_pitch += delta_pitch
-        self.running_roll += delta_roll
-        self.running_yaw += delta_yaw
-        enable_irq(state)
\ No newline at end of file
+        self._int_pitch += avg_p * whole + ((avg_p * frac) >> 6)
+        self._int_roll += avg_r * whole + ((avg_r * frac) >> 6)
+        self._int_yaw += avg_y * whole + ((avg_y * frac) >> 6)
+        enable_irq(state)
+        self._prev_gx = gx
+        self._prev_gy = gy
+        self._prev_gz = gz
+
+        if self._still_window:
+            self._still_sample(gx, gy, gz, data)
+        if self._hist_size:
+            self._record(now)
+
+        if (self._int_pitch > _FOLD_LIMIT or self._int_pitch < -_FOLD_LIMIT or
+                self._int_roll > _FOLD_LIMIT or self._int_roll < -_FOLD_LIMIT or
+                self._int_yaw > _FOLD_LIMIT or self._int_yaw < -_FOLD_LIMIT):
+            self._fold()
+        if self._dt_sum_us > _FOLD_LIMIT:
+            # Every few minutes; the float add is the only allocation
+            self._dt_total_us += self._dt_sum_us
+            self._dt_sum_us = 0
+
+        if self._fusion is not None:
+            # Sum raw samples; the filter's float math runs once every _fusion_decimation ticks
+            self._fusion_gx += gx
+            self._fusion_gy += gy
+            self._fusion_gz += gz
+            self._fusion_ax += data.AX
+            self._fusion_ay += data.AY
+            self._fusion_az += data.AZ
+            self._fusion_us += dt
+            self._fusion_count += 1
+            if self._fusion_count >= self._fusion_decimation:
+                self._run_fusion(self._fusion_gx, self._fusion_gy, self._fusion_gz,
+                                 self._fusion_ax, self._fusion_ay, self._fusion_az,
+                                 self._fusion_count, self._fusion_us / 1000000)
+                self._fusion_count = 0
+                self._fusion_us = 0
+                self._fusion_gx = self._fusion_gy = self._fusion_gz = 0
+                self._fusion_ax = self._fusion_ay = self._fusion_az = 0
\ No newline at end of file
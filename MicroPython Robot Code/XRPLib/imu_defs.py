@@ -1,4 +1,4 @@
-from uctypes import BFUINT8, BF_POS, BF_LEN
+from uctypes import BFUINT8, BF_POS, BF_LEN, INT16
 from micropython import const
 
 """
@@ -10,10 +10,17 @@ LSM_ADDR_SECONDARY = const(0x6A)
 """
 	Register addresses
 """
+LSM_REG_FIFO_CTRL1       = const(0x07)
+LSM_REG_FIFO_CTRL2       = const(0x08)
+LSM_REG_FIFO_CTRL3       = const(0x09)
+LSM_REG_FIFO_CTRL4       = const(0x0A)
+LSM_REG_INT1_CTRL        = const(0x0D)
 LSM_REG_WHO_AM_I         = const(0x0F)
 LSM_REG_CTRL1_XL         = const(0x10)
 LSM_REG_CTRL2_G          = const(0x11)
 LSM_REG_CTRL3_C          = const(0x12)
+LSM_REG_CTRL10_C         = const(0x19)
+LSM_REG_STATUS           = const(0x1E)
 LSM_REG_OUT_TEMP_L       = const(0x20)
 LSM_REG_OUT_TEMP_H       = const(0x21)
 LSM_REG_OUTX_L_G         = const(0x22)
@@ -22,6 +29,9 @@ LSM_REG_OUTZ_L_G         = const(0x26)
 LSM_REG_OUTX_L_A         = const(0x28)
 LSM_REG_OUTY_L_A         = const(0x2A)
 LSM_REG_OUTZ_L_A         = const(0x2C)
+LSM_REG_FIFO_STATUS1     = const(0x3A)
+LSM_REG_FIFO_STATUS2     = const(0x3B)
+LSM_REG_FIFO_DATA_OUT_TAG = const(0x78)
 
 """
 	Bit field struct definitions of registers
@@ -35,6 +45,16 @@ LSM_REG_LAYOUT_CTRL2_G = {
     "ODR_G" : BFUINT8 | 4 << BF_POS | 4 << BF_LEN,
     "FS_G"  : BFUINT8 | 1 << BF_POS | 3 << BF_LEN,
 }
+# Gyro then accel output registers, as read in one burst from OUTX_L_G
+LSM_OUT_LAYOUT = {
+    "GX" : INT16 | 0,
+    "GY" : INT16 | 2,
+    "GZ" : INT16 | 4,
+    "AX" : INT16 | 6,
+    "AY" : INT16 | 8,
+    "AZ" : INT16 | 10,
+}
+LSM_OUT_SIZE = const(12)
 LSM_REG_LAYOUT_CTRL3_C = {
     "BOOT"      : BFUINT8 | 7 << BF_POS | 1 << BF_LEN,
     "BDU"       : BFUINT8 | 6 << BF_POS | 1 << BF_LEN,
@@ -75,6 +95,34 @@ LSM_GYRO_FS = {
 	"2000dps" : 0x6,
 }
 
+"""
+	Reverse lookups from register field value to setting
+"""
+LSM_ODR_NAMES      = {v: k for k, v in LSM_ODR.items()}
+LSM_ACCEL_FS_NAMES = {v: k for k, v in LSM_ACCEL_FS.items()}
+LSM_GYRO_FS_NAMES  = {v: k for k, v in LSM_GYRO_FS.items()}
+
+"""
+    STATUS_REG bits
+"""
+LSM_STATUS_TDA           = const(0x04) # New temperature sample available
+
+"""
+    FIFO settings
+"""
+LSM_FIFO_MODE_BYPASS     = const(0x00)
+LSM_FIFO_MODE_CONTINUOUS = const(0x06)
+LSM_FIFO_DEC_TS_BATCH_1  = const(0x40) # Timestamp word batched with every sample
+LSM_FIFO_STATUS2_OVR     = const(0x40)
+LSM_FIFO_TAG_GYRO        = const(0x01)
+LSM_FIFO_TAG_ACCEL       = const(0x02)
+LSM_FIFO_TAG_TIMESTAMP   = const(0x04)
+LSM_FIFO_WORD_SIZE       = const(7)    # Tag byte + 6 data bytes
+LSM_FIFO_MAX_WORDS       = const(438)  # 3 KB
+LSM_INT1_FIFO_TH         = const(0x08)
+LSM_CTRL10_TIMESTAMP_EN  = const(0x20)
+LSM_TIMESTAMP_US_PER_LSB = const(25)
+
 """
     Other contants
 """
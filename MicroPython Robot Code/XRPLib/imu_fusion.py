@@ -0,0 +1,213 @@
+"""
+Accelerometer + gyroscope fusion filters for the IMU.
+
+Both filters take gyro rates in degrees per second about the IMU's X (pitch), Y (roll)
+and Z (yaw) axes, and an accelerometer vector in any unit (only its direction is used).
+Pitch and roll are corrected towards gravity, so they no longer drift; yaw has no
+absolute reference and is integrated from the gyro alone.
+"""
+
+import math
+
+_DEG = 180 / math.pi
+_RAD = math.pi / 180
+
+
+class ComplementaryFilter:
+
+    def __init__(self, time_constant: float = 0.5):
+        """
+        Blends the integrated gyro angle with the accelerometer's tilt angle. The gyro is
+        trusted for changes faster than time_constant, the accelerometer for slower ones.
+        Cheapest option: two atan2 and a handful of multiplies per update.
+
+        :param time_constant: Crossover time in seconds
+        :type time_constant: float
+        """
+        self.time_constant = time_constant
+        self.reset()
+
+    def reset(self, pitch: float = 0, roll: float = 0, yaw: float = 0):
+        """
+        Set the filter state, in degrees.
+        """
+        self._pitch = pitch
+        self._roll = roll
+        self._yaw = yaw
+        self._pitch_offset = 0
+        self._roll_offset = 0
+        self._initialized = False
+
+    def update(self, gx, gy, gz, ax, ay, az, dt):
+        """
+        :param gx, gy, gz: Gyro rates in degrees per second
+        :param ax, ay, az: Accelerometer vector, any unit
+        :param dt: Time since the last update in seconds
+        """
+        acc_pitch = math.atan2(ay, az) * _DEG
+        acc_roll = math.atan2(-ax, math.sqrt(ay * ay + az * az)) * _DEG
+        if not self._initialized:
+            # Start from the accelerometer rather than converging from zero
+            self._pitch = acc_pitch
+            self._roll = acc_roll
+            self._initialized = True
+        alpha = self.time_constant / (self.time_constant + dt)
+        self._pitch = alpha * (self._pitch + gx * dt) + (1 - alpha) * acc_pitch
+        self._roll = alpha * (self._roll + gy * dt) + (1 - alpha) * acc_roll
+        self._yaw += gz * dt
+
+    def set_angles(self, pitch: float = None, roll: float = None):
+        """
+        Make pitch() and roll() read the given angles from now on, in degrees. Gravity keeps
+        correcting the estimate, so this sets a reference offset rather than the tilt itself.
+        reset() clears the offsets.
+        """
+        if pitch is not None:
+            self._pitch_offset = pitch - self._pitch
+        if roll is not None:
+            self._roll_offset = roll - self._roll
+
+    def pitch(self) -> float:
+        return self._pitch + self._pitch_offset
+
+    def roll(self) -> float:
+        return self._roll + self._roll_offset
+
+    def yaw(self) -> float:
+        return self._yaw
+
+    def quaternion(self) -> tuple:
+        """
+        :return: Orientation as (w, x, y, z), rotating X (pitch), then Y (roll), then Z (yaw)
+        :rtype: tuple
+        """
+        hp = self._pitch * _RAD / 2
+        hr = self._roll * _RAD / 2
+        hy = self._yaw * _RAD / 2
+        cp, sp = math.cos(hp), math.sin(hp)
+        cr, sr = math.cos(hr), math.sin(hr)
+        cy, sy = math.cos(hy), math.sin(hy)
+        return (cy * cr * cp + sy * sr * sp,
+                cy * cr * sp - sy * sr * cp,
+                cy * sr * cp + sy * cr * sp,
+                sy * cr * cp - cy * sr * sp)
+
+
+class MahonyFilter:
+
+    def __init__(self, kp: float = 3.0, ki: float = 0.3):
+        """
+        Quaternion orientation filter (Mahony et al.). The error between measured and
+        estimated gravity drives a PI correction of the gyro rates before they are
+        integrated. No trigonometry in the update; angles are only computed when asked for.
+
+        :param kp: Proportional gain on the gravity error; higher converges faster but lets more
+            accelerometer noise through
+        :type kp: float
+        :param ki: Integral gain, which also estimates gyro bias on pitch and roll
+        :type ki: float
+        """
+        self.kp = kp
+        self.ki = ki
+        self.reset()
+
+    def reset(self, pitch: float = 0, roll: float = 0, yaw: float = 0):
+        """
+        Set the filter state, in degrees.
+        """
+        f = ComplementaryFilter()
+        f.reset(pitch, roll, yaw)
+        self._q0, self._q1, self._q2, self._q3 = f.quaternion()
+        self._ix = self._iy = self._iz = 0.0
+        self._yaw = yaw
+        self._pitch_offset = 0
+        self._roll_offset = 0
+
+    def update(self, gx, gy, gz, ax, ay, az, dt):
+        """
+        :param gx, gy, gz: Gyro rates in degrees per second
+        :param ax, ay, az: Accelerometer vector, any unit
+        :param dt: Time since the last update in seconds
+        """
+        q0, q1, q2, q3 = self._q0, self._q1, self._q2, self._q3
+        gx *= _RAD
+        gy *= _RAD
+        gz *= _RAD
+        self._yaw += gz * dt * _DEG
+
+        norm = ax * ax + ay * ay + az * az
+        if norm > 0:
+            norm = 1 / math.sqrt(norm)
+            ax *= norm
+            ay *= norm
+            az *= norm
+            # Estimated direction of gravity in the body frame
+            vx = 2 * (q1 * q3 - q0 * q2)
+            vy = 2 * (q0 * q1 + q2 * q3)
+            vz = q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3
+            # Error is the cross product between measured and estimated gravity
+            ex = ay * vz - az * vy
+            ey = az * vx - ax * vz
+            ez = ax * vy - ay * vx
+            if self.ki > 0:
+                self._ix += self.ki * ex * dt
+                self._iy += self.ki * ey * dt
+                self._iz += self.ki * ez * dt
+                gx += self._ix
+                gy += self._iy
+                gz += self._iz
+            gx += self.kp * ex
+            gy += self.kp * ey
+            gz += self.kp * ez
+
+        # Integrate the quaternion rate
+        half_dt = 0.5 * dt
+        gx *= half_dt
+        gy *= half_dt
+        gz *= half_dt
+        q0, q1, q2, q3 = (q0 - q1 * gx - q2 * gy - q3 * gz,
+                          q1 + q0 * gx + q2 * gz - q3 * gy,
+                          q2 + q0 * gy - q1 * gz + q3 * gx,
+                          q3 + q0 * gz + q1 * gy - q2 * gx)
+        norm = 1 / math.sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+        self._q0 = q0 * norm
+        self._q1 = q1 * norm
+        self._q2 = q2 * norm
+        self._q3 = q3 * norm
+
+    def _tilt(self):
+        # Pitch and roll of the quaternion, without the set_angles() offsets
+        q0, q1, q2, q3 = self._q0, self._q1, self._q2, self._q3
+        vx = 2 * (q1 * q3 - q0 * q2)
+        vy = 2 * (q0 * q1 + q2 * q3)
+        vz = q0 * q0 - q1 * q1 - q2 * q2 + q3 * q3
+        return math.atan2(vy, vz) * _DEG, math.atan2(-vx, math.sqrt(vy * vy + vz * vz)) * _DEG
+
+    def set_angles(self, pitch: float = None, roll: float = None):
+        """
+        Make pitch() and roll() read the given angles from now on, in degrees. Gravity keeps
+        correcting the estimate, so this sets a reference offset rather than the orientation;
+        quaternion() is unaffected. reset() clears the offsets.
+        """
+        tilt_pitch, tilt_roll = self._tilt()
+        if pitch is not None:
+            self._pitch_offset = pitch - tilt_pitch
+        if roll is not None:
+            self._roll_offset = roll - tilt_roll
+
+    def pitch(self) -> float:
+        return self._tilt()[0] + self._pitch_offset
+
+    def roll(self) -> float:
+        return self._tilt()[1] + self._roll_offset
+
+    def yaw(self) -> float:
+        # Unbounded, like IMU.get_yaw(); the quaternion's yaw wraps at +/-180
+        return self._yaw
+
+    def quaternion(self) -> tuple:
+        """
+        :return: Orientation as (w, x, y, z)
+        :rtype: tuple
+        """
+        return self._q0, self._q1, self._q2, self._q3
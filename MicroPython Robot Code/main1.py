@@ -1,14 +1,18 @@
 # https://projects.raspberrypi.org/en/projects/get-started-pico-w/2 
 from XRPLib.defaults import *
-import network
 import machine
 from time import sleep
 import time
 from machine import Pin 
-import usocket as socket
+import uasyncio as asyncio
 
 from ColorSensor import TCS34725
-from TSEwebsocket import WebSocketClient
+from TSEwebsocket_async import AsyncWebSocketClient
+from ControlMailbox import ControlMailbox
+from Telemetry import TelemetryUplink
+from Session import ReconnectingSession
+from TeleopMixer import TeleopMixer
+from Watchdog import CommandWatchdog
 
 
 print("* Starting up ")
@@ -24,16 +28,39 @@ wsPath = "/ws"
 pin = Pin("LED", Pin.OUT)
 
 # INITS
-ws = socket.socket()
-#sensor = TCS34725()
-
-# TESTING WS LIB
-ws = WebSocketClient(wsHost, wsPort, wsPath)
+# The color sensor is optional. When fitted it samples in the background every
+# integration cycle, so reads never block
+try:
+    sensor = TCS34725()
+    sensor.start_sampling(history=32)
+except (OSError, RuntimeError):
+    print("* No color sensor, continuing without it")
+    sensor = None
+
+ws = AsyncWebSocketClient(wsHost, wsPort, wsPath)
+# Ping often so a dead link is noticed within a few seconds
+ws.ping_interval = 5
+ws.pong_timeout = 3
+
+# Latest merged control state from the browser, and a flag set when it changes
+mailbox = ControlMailbox()
+command_ready = asyncio.Event()
+
+# Keys/joystick -> wheel efforts, ramped at 4 effort/s on a 50 Hz tick
+mixer = TeleopMixer(drivetrain, slew_rate=4.0, tick_hz=50)
+
+# Sensor state streamed back to the operator, 10 samples per message at 100 Hz.
+# The rangefinder blocks for up to 30 ms per read, so it isn't sampled here.
+# Without a color sensor its fields are sent as zeros.
+telemetry = TelemetryUplink(ws, drivetrain=drivetrain, imu=imu, reflectance=reflectance,
+                            color_sensor=sensor, rate_hz=100, batch_size=10)
 
 # GENERAL FUNCS ----------------------------------------------
 def cleanup():
     print("Cleaning up ")
     pin.off()
+    if sensor:
+        sensor.stop_sampling()
     if ws:
         ws.close()
     machine.reset()
@@ -43,79 +70,72 @@ def blink():
     sleep(0.5)
     pin.toggle()
 
-# WIFI FUNCS --------------------------------------------------
-def connect():
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    wlan.connect(ssid, password)
-
-    print('* Waiting for WiFi connection...', end="")
-    
-    max_wait = 30
-    while max_wait > 0:
-        if wlan.isconnected():
-            break
-        max_wait -= 1
-        print(".", end="")
-        sleep(1)
-    
-    if wlan.isconnected():
-        print("\n* Wifi Connected!")
-        print(f"* IP Address: {wlan.ifconfig()[0]}")
-        return True
-    else:
-        print("\n* WiFi connection failed!")
-        return False
-
 # Actuators
 def motor_control(data):
-    if(data["w"] == True):
-        drivetrain.set_effort(1, 1)
-    elif(data["s"] == True):
-        drivetrain.set_effort(-1, -1)
-    elif(data["a"] == True):
-        drivetrain.set_effort(0, 1)
-    elif(data["d"] == True):    
-        drivetrain.set_effort(1, 0)
-    elif(data["w"] == True and data["a"] == True):
-        drivetrain.set_effort(0.3, 1)
-    elif(data["w"] == True and data["d"] == True):
-        drivetrain.set_effort(1, 0.3)
-    elif(data["w"] == False and data["s"] == False and data["a"] == False and data["d"] == False):
-        drivetrain.set_effort(0, 0)
+    # Sets the mixer's target; the mixer task ramps the motors towards it
+    mixer.apply(data)
 
 def setServo(data):
     servo_one.set_angle(data["servo"])
 
-# SETUP  -----------------------------------------------------------
-try:
-    if not connect():
-        print("* WiFi setup failed")
-        sleep(5)
-        cleanup()
-        
-    if not ws.connect():
-        print("* WebSocket setup failed")
-        sleep(5)
-        cleanup()
+def safe_stop():
+    # Hold the robot still while the link is down
+    mailbox.reset()
+    mixer.stop()
+    drivetrain.stop()
+
+def deadman_stop():
+    # No fresh command in time: stop driving and let the servo go limp
+    safe_stop()
+    servo_one.free()
+
+# Stops the robot if the operator's commands stop arriving for 250 ms.
+# The browser has to resend its current state faster than this while keys are held.
+watchdog = CommandWatchdog(deadman_stop, deadline_ms=250)
+
+# TASKS -----------------------------------------------------------
+async def network_task():
+    # Merge messages into the mailbox as they arrive; returns when the connection drops
+    async for message in ws:
+        if mailbox.post_message(message):
+            watchdog.feed()
+            command_ready.set()
+
+async def drive_task():
+    while True:
+        await command_ready.wait()
+        command_ready.clear()
+        # Only ever act on the freshest state; anything older was merged away
+        data = mailbox.take()
+        if data is not None:
+            motor_control(data)
+            setServo(data)
+
+async def on_connected():
+    # Per-connection tasks; they end on their own once ws drops
+    print(" --------------------------------------------")
+    asyncio.create_task(ws.keepalive())
+    asyncio.create_task(telemetry.run())
+    await network_task()
+    print(f"* Mailbox {mailbox.stats()}")
+    print(f"* Watchdog {watchdog.stats()}")
+
+async def main():
+    # WiFi and WebSocket setup, and any reconnects, are handled by the session
+    session = ReconnectingSession(ws, ssid, password, safe_stop=safe_stop)
 
     print("* Setup complete, entering main loop")
-    print(" --------------------------------------------")
-    
+
+    asyncio.create_task(drive_task())
+    asyncio.create_task(mixer.run())
+    watchdog.start()
+    await session.run(on_connected)
+
+# SETUP  -----------------------------------------------------------
+try:
     # MAIN LOOP -----------------------------------------------------------    
-    while True:
-        message = ws.handle_websocket()
-        
-        if message is False:
-            print("* Connection issue detected, cleaning up")
-            cleanup()
-        elif message is not None:
-            motor_control(message)
-            setServo(message)
-            
-        #r,g,b,c =  sensor.read_rgbc()
-
-        
+    asyncio.run(main())
+
 except KeyboardInterrupt:
     print("* Connection stopped by user")
 except Exception as e:
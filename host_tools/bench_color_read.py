@@ -0,0 +1,111 @@
+"""
+Host-side benchmark of the TCS34725 RGBC read path on a simulated I2C bus.
+
+Compares the original read (STATUS poll, then four 2-byte readfrom_mem calls)
+with the single burst read of STATUS + all channels. The simulated bus charges
+every transaction its bit time at the given clock, so samples/sec reflects the
+I2C cost on the robot; CPU time and heap allocations are measured on the host.
+
+Usage: python3 host_tools/bench_color_read.py [bus_hz] [samples]
+"""
+
+import struct
+import sys
+import time
+import tracemalloc
+
+import mpy_compat
+
+mpy_compat.install()
+
+from ColorSensor import TCS34725
+
+
+class SimulatedI2C:
+    """TCS34725 register file behind an I2C bus that accounts transaction time."""
+
+    def __init__(self, freq=400000):
+        self.freq = freq
+        self.regs = bytearray(32)
+        self.regs[0x12] = 0x44  # ID
+        self.regs[0x13] = 0x01  # STATUS: AVALID
+        struct.pack_into("<HHHH", self.regs, 0x14, 1200, 500, 400, 300)  # C, R, G, B
+        self.transactions = 0
+        self.bus_s = 0.0
+
+    def _charge(self, write_bytes, read_bytes):
+        # START, address + write bytes, then repeated START, address + read bytes, STOP;
+        # 9 clocks per byte including ACK
+        bits = 1 + 9 * (1 + write_bytes)
+        if read_bytes:
+            bits += 1 + 9 * (1 + read_bytes)
+        self.bus_s += (bits + 1) / self.freq
+        self.transactions += 1
+
+    def readfrom_mem(self, addr, reg, n):
+        buf = bytearray(n)
+        self.readfrom_mem_into(addr, reg, buf)
+        return bytes(buf)
+
+    def readfrom_mem_into(self, addr, reg, buf):
+        self._charge(1, len(buf))
+        start = reg & 0x1F
+        buf[:] = self.regs[start:start + len(buf)]
+
+    def writeto_mem(self, addr, reg, data):
+        self._charge(1 + len(data), 0)
+        start = reg & 0x1F
+        self.regs[start:start + len(data)] = data
+
+    def writeto(self, addr, data):
+        self._charge(len(data), 0)
+
+
+def legacy_read_rgbc(sensor):
+    # Verbatim copy of the original read_rgbc, for comparison
+    while not sensor._data_ready():
+        time.sleep_ms(int(sensor._integration_time) + 1)
+    clear = sensor._read_word(0x14)
+    red = sensor._read_word(0x16)
+    green = sensor._read_word(0x18)
+    blue = sensor._read_word(0x1A)
+    return red, green, blue, clear
+
+
+def measure(name, read, sensor, samples):
+    bus = sensor.i2c
+    expected = read(sensor)
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    read(sensor)
+    transient = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    bus.transactions = 0
+    bus.bus_s = 0.0
+    t0 = time.perf_counter()
+    for _ in range(samples):
+        assert read(sensor) == expected
+    cpu_s = time.perf_counter() - t0
+
+    per_sample = bus.bus_s / samples
+    print(f"{name:<8} {bus.transactions / samples:>4.0f} transactions/sample  "
+          f"{per_sample * 1e6:>7.1f} us bus/sample  {1 / per_sample:>8.0f} samples/s on bus  "
+          f"{samples / cpu_s:>9.0f} samples/s host CPU  {transient:>4} B transient heap")
+    return 1 / per_sample
+
+
+def main():
+    bus_hz = int(sys.argv[1]) if len(sys.argv) > 1 else 400000
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    sensor = TCS34725(SimulatedI2C(bus_hz))
+    print(f"I2C at {bus_hz} Hz, {samples} samples")
+    legacy = measure("legacy", legacy_read_rgbc, sensor, samples)
+    burst = measure("burst", TCS34725.read_rgbc, sensor, samples)
+    print(f"bus-limited speedup: {burst / legacy:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Host-side throughput benchmark of the teleop control encodings.
+
+Decodes a stream of control messages into a ControlMailbox, once as JSON text
+(the original format) and once as binary ControlProtocol frames, and reports
+messages/sec for each.
+
+Usage: python3 host_tools/bench_control_protocol.py [message_count]
+"""
+
+import json
+import sys
+import time
+
+import mpy_compat
+
+mpy_compat.install()
+
+from ControlMailbox import ControlMailbox
+from ControlProtocol import encode_control, CONTROL_SIZE
+
+
+def make_messages(count):
+    text, binary = [], []
+    for i in range(count):
+        w, a, s, d = bool(i & 1), bool(i & 2), bool(i & 4), bool(i & 8)
+        servo = 45 + i % 90
+        text.append(json.dumps({"w": w, "a": a, "s": s, "d": d, "servo": servo}))
+        buf = bytearray(CONTROL_SIZE)
+        encode_control(buf, w, a, s, d, servo, seq=i)
+        binary.append(bytes(buf))
+    return text, binary
+
+
+def run(messages):
+    mailbox = ControlMailbox()
+    t0 = time.perf_counter()
+    for message in messages:
+        mailbox.post_message(message)
+        mailbox.take()
+    elapsed = time.perf_counter() - t0
+    assert mailbox.dropped == 0
+    return len(messages) / elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    text, binary = make_messages(count)
+    json_rate = run(text)
+    binary_rate = run(binary)
+    print(f"JSON:   {json_rate:>12.0f} msg/s  ({len(text[0])} bytes/msg)")
+    print(f"binary: {binary_rate:>12.0f} msg/s  ({CONTROL_SIZE} bytes/msg)")
+    print(f"speedup: {binary_rate / json_rate:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
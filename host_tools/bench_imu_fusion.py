@@ -0,0 +1,120 @@
+"""
+Host-side benchmark of the IMU fusion filters.
+
+Simulates the robot rocking in pitch and roll while turning, sampled at the IMU
+rate with gyro noise and a residual gyro bias, and feeds the same samples to
+plain gyro integration (what IMU.get_pitch/get_roll did before) and to each
+filter in XRPLib.imu_fusion, updated every `decimation` samples like the IMU
+timer does. Reports host time per filter update and pitch/roll error.
+Then checks that set_angles(), which IMU.set_pitch/set_roll forward to while
+a filter is set, moves the reference: the angles read as set and then follow
+the true motion.
+
+Usage: python3 host_tools/bench_imu_fusion.py [seconds] [rate_hz] [decimation]
+"""
+
+import math
+import random
+import sys
+import time
+
+import mpy_compat
+
+mpy_compat.install()
+
+from XRPLib.imu_fusion import ComplementaryFilter, MahonyFilter
+
+
+def simulate(seconds, rate_hz):
+    """Yield (true_pitch, true_roll, gx, gy, gz, ax, ay, az) per sample, degrees and mg."""
+    rng = random.Random(1)
+    bias = (0.4, -0.3, 0.2)  # deg/s left over after calibration
+    dt = 1 / rate_hz
+    prev_p = prev_r = 0.0
+    for i in range(int(seconds * rate_hz)):
+        t = i * dt
+        pitch = 10 * math.sin(2 * math.pi * 0.2 * t)
+        roll = 6 * math.sin(2 * math.pi * 0.13 * t + 1)
+        gx = (pitch - prev_p) / dt if i else 0.0
+        gy = (roll - prev_r) / dt if i else 0.0
+        prev_p, prev_r = pitch, roll
+        p, r = math.radians(pitch), math.radians(roll)
+        # Gravity in the body frame for X (pitch) then Y (roll) rotation, plus noise
+        ax = -math.sin(r) * 1000 + rng.gauss(0, 15)
+        ay = math.cos(r) * math.sin(p) * 1000 + rng.gauss(0, 15)
+        az = math.cos(r) * math.cos(p) * 1000 + rng.gauss(0, 15)
+        yield (pitch, roll, gx + bias[0] + rng.gauss(0, 0.1), gy + bias[1] + rng.gauss(0, 0.1),
+               30 + bias[2] + rng.gauss(0, 0.1), ax, ay, az)
+
+
+def run(name, make_filter, samples, rate_hz, decimation):
+    dt = 1 / rate_hz
+    f = make_filter() if make_filter else None
+    pitch = roll = 0.0
+    sums = [0.0] * 6
+    count = 0
+    cost = 0.0
+    updates = 0
+    sq_err = 0.0
+    final = 0.0
+    for true_p, true_r, gx, gy, gz, ax, ay, az in samples:
+        if f is None:
+            pitch += gx * dt
+            roll += gy * dt
+        else:
+            for k, v in enumerate((gx, gy, gz, ax, ay, az)):
+                sums[k] += v
+            count += 1
+            if count == decimation:
+                args = [v / count for v in sums]
+                t0 = time.perf_counter()
+                f.update(*args, count * dt)
+                cost += time.perf_counter() - t0
+                updates += 1
+                sums = [0.0] * 6
+                count = 0
+            pitch, roll = f.pitch(), f.roll()
+        err = math.hypot(pitch - true_p, roll - true_r)
+        sq_err += err * err
+        final = err
+    rms = math.sqrt(sq_err / len(samples))
+    per_update = f"{cost / updates * 1e6:7.2f} us/update" if updates else "   (per sample)  "
+    print(f"{name:<14} {per_update}  rms error {rms:6.2f} deg  final error {final:6.2f} deg")
+
+
+def check_set_angles(name, make_filter, samples, rate_hz):
+    dt = 1 / rate_hz
+    f = make_filter()
+    half = len(samples) // 2
+    for true_p, true_r, gx, gy, gz, ax, ay, az in samples[:half]:
+        f.update(gx, gy, gz, ax, ay, az, dt)
+    f.set_angles(pitch=0, roll=5)
+    assert abs(f.pitch()) < 1e-6 and abs(f.roll() - 5) < 1e-6, (f.pitch(), f.roll())
+    # From here the readings should be the true angles shifted by the same offsets
+    ref_p, ref_r = samples[half - 1][0], samples[half - 1][1] - 5
+    worst = 0.0
+    for true_p, true_r, gx, gy, gz, ax, ay, az in samples[half:]:
+        f.update(gx, gy, gz, ax, ay, az, dt)
+        worst = max(worst, abs(f.pitch() - (true_p - ref_p)), abs(f.roll() - (true_r - ref_r)))
+    f.reset()
+    assert f.pitch() == 0 and f.roll() == 0
+    print(f"{name:<14} set_angles ok, worst error after {worst:6.2f} deg")
+    assert worst < 5, worst
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 120
+    rate_hz = int(sys.argv[2]) if len(sys.argv) > 2 else 208
+    decimation = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    samples = list(simulate(seconds, rate_hz))
+    print(f"{seconds:.0f} s at {rate_hz} Hz, filter updated every {decimation} samples "
+          f"(budget {1e6 * decimation / rate_hz:.0f} us per update on the robot)")
+    run("gyro only", None, samples, rate_hz, decimation)
+    run("complementary", ComplementaryFilter, samples, rate_hz, decimation)
+    run("mahony", MahonyFilter, samples, rate_hz, decimation)
+    check_set_angles("complementary", ComplementaryFilter, samples, rate_hz)
+    check_set_angles("mahony", MahonyFilter, samples, rate_hz)
+
+
+if __name__ == "__main__":
+    main()
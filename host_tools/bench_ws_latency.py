@@ -0,0 +1,230 @@
+"""
+Command-latency benchmark for the TSEwebsocket clients over loopback.
+
+Starts the ws_server stand-in, connects a WebSocketClient (or
+AsyncWebSocketClient with --client async) to it from a thread that emulates
+the robot loop, and replays a key-press stream. The robot side answers every
+control state it acts on with {"ack": seq}, so the server can time the full
+command round trip. Messages merged away by the client's mailbox are reported
+as coalesced rather than timed.
+
+Recorded streams are JSON lines: {"t": ms_since_start, "w": bool, "a": bool,
+"s": bool, "d": bool, "servo": angle}. Without --record a synthetic stream
+cycling through key combinations is used.
+
+Usage examples:
+    python3 host_tools/bench_ws_latency.py
+    python3 host_tools/bench_ws_latency.py --delay-ms 20 --chunk-size 3 --fragment-size 8
+    python3 host_tools/bench_ws_latency.py --binary --client async --pong-delay-ms 1500
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+
+import mpy_compat
+
+mpy_compat.install()
+
+from ControlProtocol import encode_control, CONTROL_SIZE
+from TSEwebsocket import WebSocketClient
+from TSEwebsocket_async import AsyncWebSocketClient
+from ws_server import StandInServer
+
+
+def load_stream(path, count, rate_hz):
+    if path:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    combos = ["w", "wa", "w", "wd", "", "s", "a", "d", ""]
+    stream = []
+    for i in range(count):
+        keys = combos[(i // 5) % len(combos)]
+        entry = {k: k in keys for k in "wasd"}
+        entry["servo"] = 45 + i % 90
+        entry["t"] = i * 1000 / rate_hz
+        stream.append(entry)
+    return stream
+
+
+class RobotSide:
+    """Runs a client in its own thread, acking every control state it acts on."""
+
+    def __init__(self, kind, port, binary, ping_interval):
+        self.kind = kind
+        self.port = port
+        self.binary = binary
+        self.ping_interval = ping_interval
+        self.stop = threading.Event()
+        self.connected = threading.Event()
+        self.pong_timeouts = 0
+        self.pings_sent = 0
+        self.client = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        if not self.connected.wait(5):
+            raise RuntimeError("client failed to connect")
+
+    def _run(self):
+        if self.kind == "async":
+            asyncio.run(self._run_async())
+        else:
+            self._run_sync()
+
+    def _run_sync(self):
+        ws = WebSocketClient("127.0.0.1", self.port, "/ws", binary=self.binary)
+        ws.ping_interval = self.ping_interval
+        ws.pong_timeout = self.ping_interval / 2
+        self.client = ws
+        if not ws.connect():
+            return
+        self.connected.set()
+        last_ping = ws.last_ping_sent
+        while not self.stop.is_set():
+            data = ws.handle_websocket(timeout=0.005)
+            if ws.last_ping_sent != last_ping:
+                self.pings_sent += 1
+                last_ping = ws.last_ping_sent
+            if data is False:
+                # Dead link according to the ping/pong state; start a fresh ping cycle
+                self.pong_timeouts += 1
+                ws.last_ping_sent = ws.last_pong_received = time.time()
+                continue
+            if data is not None:
+                ws.send_message(json.dumps({"ack": data["seq"]}))
+        ws.close()
+
+    async def _run_async(self):
+        ws = AsyncWebSocketClient("127.0.0.1", self.port, "/ws", binary=self.binary)
+        ws.ping_interval = self.ping_interval * 2
+        ws.pong_timeout = self.ping_interval
+        self.client = ws
+        if not await ws.connect():
+            return
+        self.connected.set()
+
+        async def watch():
+            last_ping = 0
+            while not self.stop.is_set():
+                await asyncio.sleep(0.05)
+                if ws.last_ping_sent != last_ping:
+                    self.pings_sent += 1
+                    last_ping = ws.last_ping_sent
+            ws.close()
+
+        keepalive = asyncio.ensure_future(ws.keepalive())
+        watcher = asyncio.ensure_future(watch())
+        async for message in ws:
+            if ws.mailbox.post_message(message):
+                data = ws.mailbox.take()
+                await ws.send(json.dumps({"ack": data["seq"]}))
+        if not self.stop.is_set():
+            self.pong_timeouts += 1
+        keepalive.cancel()
+        watcher.cancel()
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run(args):
+    server = await StandInServer(delay_ms=args.delay_ms, chunk_size=args.chunk_size,
+                                 fragment_size=args.fragment_size,
+                                 pong_delay_ms=None if args.pong_delay_ms < 0 else args.pong_delay_ms,
+                                 protocols=("tse.control.v1", "tse.json") if args.binary else ("tse.json",)
+                                 ).start()
+    robot = RobotSide(args.client, server.port, args.binary, args.ping_interval)
+    await asyncio.get_running_loop().run_in_executor(None, robot.start)
+    conn = await server.accept()
+
+    stream = load_stream(args.record, args.count, args.rate_hz)
+    sent_at = {}
+    rtts = []
+
+    async def collect():
+        async for opcode, payload in conn.messages():
+            seq = json.loads(payload).get("ack")
+            if seq in sent_at:
+                rtts.append((time.perf_counter() - sent_at.pop(seq)) * 1000)
+
+    async def pinger():
+        while not conn.closed:
+            await conn.ping()
+            await asyncio.sleep(args.ping_interval)
+
+    collector = asyncio.ensure_future(collect())
+    pings = asyncio.ensure_future(pinger())
+    buf = bytearray(CONTROL_SIZE)
+    sent = 0
+    start = time.perf_counter()
+    for seq, entry in enumerate(stream):
+        if conn.closed:
+            print(f"* Client dropped the connection after {seq} commands")
+            break
+        delay = start + entry["t"] / 1000 - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        seq &= 0xFFFF
+        sent_at[seq] = time.perf_counter()
+        if conn.protocol == "tse.control.v1":
+            encode_control(buf, entry.get("w"), entry.get("a"), entry.get("s"), entry.get("d"),
+                           entry.get("servo", 90), seq=seq)
+            message = bytes(buf)
+        else:
+            message = {k: v for k, v in entry.items() if k != "t"}
+            message["seq"] = seq
+            message = json.dumps(message)
+        try:
+            await conn.send(message)
+            sent += 1
+        except ConnectionError:
+            conn.closed = True
+    await asyncio.sleep(0.5)  # let the last acks arrive
+    elapsed = time.perf_counter() - start
+
+    robot.stop.set()
+    await asyncio.get_running_loop().run_in_executor(None, robot.thread.join, 5)
+    pings.cancel()
+    collector.cancel()
+    await server.stop()
+
+    mailbox = robot.client.mailbox
+    print(f"client={args.client} protocol={conn.protocol} delay={args.delay_ms}ms "
+          f"chunk={args.chunk_size} fragment={args.fragment_size}")
+    print(f"commands sent      {sent} of {len(stream)}")
+    print(f"commands acked     {len(rtts)}  (coalesced {mailbox.merged}, dropped {mailbox.dropped})")
+    print(f"round trip p50     {percentile(rtts, 50):.2f} ms")
+    print(f"round trip p99     {percentile(rtts, 99):.2f} ms")
+    print(f"round trip max     {max(rtts) if rtts else float('nan'):.2f} ms")
+    print(f"frames/sec         {(conn.frames_sent + conn.frames_received) / elapsed:.0f}")
+    if conn.pong_rtts_ms:
+        print(f"server ping->pong  p50 {statistics.median(conn.pong_rtts_ms):.2f} ms over {len(conn.pong_rtts_ms)} pings")
+    print(f"client pings sent  {robot.pings_sent}, pong timeouts {robot.pong_timeouts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--client", choices=("sync", "async"), default="sync")
+    parser.add_argument("--record", help="JSON-lines key-press recording to replay")
+    parser.add_argument("--count", type=int, default=1000, help="synthetic stream length")
+    parser.add_argument("--rate-hz", type=float, default=100, help="synthetic stream rate")
+    parser.add_argument("--binary", action="store_true", help="negotiate the binary control protocol")
+    parser.add_argument("--delay-ms", type=float, default=0, help="server write delay")
+    parser.add_argument("--chunk-size", type=int, default=0, help="split server writes into TCP chunks")
+    parser.add_argument("--fragment-size", type=int, default=0, help="send messages as WebSocket fragments")
+    parser.add_argument("--pong-delay-ms", type=float, default=0, help="delay pongs; negative never pongs")
+    parser.add_argument("--ping-interval", type=float, default=1, help="seconds between pings")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Host-side benchmark of the WebSocketClient send path.
+
+Compares the original per-byte generator masking + bytearray frame build with
+the preallocated in-place send path, reporting bytes/sec and transient heap
+bytes allocated per frame (measured with tracemalloc).
+
+Usage: python3 host_tools/bench_ws_send.py [payload_size ...]
+"""
+
+import os
+import struct
+import sys
+import time
+import tracemalloc
+
+import mpy_compat
+
+mpy_compat.install()
+
+from TSEwebsocket import WebSocketClient
+
+
+def legacy_send(sock, message, opcode=0x1):
+    # Verbatim copy of the original send_message framing, for comparison
+    frame = bytearray()
+    frame.append(0x80 | opcode)
+    payload = message.encode("utf-8") if isinstance(message, str) else message
+    length = len(payload)
+    if length <= 125:
+        frame.append(0x80 | length)
+    elif length <= 65535:
+        frame.append(0x80 | 126)
+        frame.extend(struct.pack(">H", length))
+    mask_key = os.urandom(4)
+    masked_payload = bytes(b ^ mask_key[i % 4] for i, b in enumerate(payload))
+    frame.extend(mask_key)
+    frame.extend(masked_payload)
+    sock.send(frame)
+
+
+def measure(send, payload, frames):
+    send(payload)  # warm up
+    # Transient heap per frame: peak traced memory above the pre-send level
+    tracemalloc.start()
+    transient = 0
+    for _ in range(100):
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        send(payload)
+        transient += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        send(payload)
+    elapsed = time.perf_counter() - t0
+    return len(payload) * frames / elapsed, transient / 100
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [16, 64, 125, 512, 4096]
+    print(f"{'size':>6} {'legacy B/s':>14} {'new B/s':>14} {'legacy heap B/frame':>20} {'new heap B/frame':>16}")
+    for size in sizes:
+        payload = bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+        frames = max(200, 200000 // size)
+
+        sock = mpy_compat.FakeSocket()
+        legacy_bps, legacy_allocs = measure(lambda p: legacy_send(sock, p), payload, frames)
+
+        client = WebSocketClient("127.0.0.1", 0, "/ws")
+        client.ws = mpy_compat.FakeSocket()
+        new_bps, new_allocs = measure(client.send_message, payload, frames)
+
+        print(f"{size:>6} {legacy_bps:>14.0f} {new_bps:>14.0f} {legacy_allocs:>20.1f} {new_allocs:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Host (CPython) compatibility shims for running robot modules off-device.
+
+Only used by the scripts in this folder. Maps the MicroPython-only modules
+and functions our code imports onto their CPython equivalents and puts the
+robot source folders on sys.path.
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+import types
+
+ROBOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "MicroPython Robot Code")
+
+
+def install():
+    sys.modules.setdefault("ujson", json)
+    sys.modules.setdefault("ustruct", struct)
+
+    if not hasattr(time, "ticks_ms"):
+        time.ticks_ms = lambda: time.monotonic_ns() // 1000000
+        time.ticks_us = lambda: time.monotonic_ns() // 1000
+        time.ticks_diff = lambda a, b: a - b
+        time.ticks_add = lambda a, b: a + b
+        time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+        time.sleep_us = lambda us: time.sleep(us / 1000000)
+
+    if "machine" not in sys.modules:
+        machine = types.ModuleType("machine")
+        machine.Pin = _Unavailable
+        machine.I2C = _Unavailable
+        machine.Timer = _Unavailable
+        machine.disable_irq = lambda: 0
+        machine.enable_irq = lambda state: None
+        sys.modules["machine"] = machine
+
+    # XRPLib refuses to import on boards other than the XRP
+    if not hasattr(sys.implementation, "_machine"):
+        sys.implementation._machine = "XRP (host)"
+
+    import builtins
+    if not hasattr(builtins, "const"):
+        builtins.const = lambda x: x
+
+    for path in (os.path.join(ROBOT_DIR, "STEM_Embassy"), ROBOT_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+class _Unavailable:
+    """Placeholder for hardware classes; benchmarks pass in simulated devices instead."""
+
+    def __init__(self, *args, **kwargs):
+        raise RuntimeError(f"{type(self).__name__} hardware is not available on the host")
+
+
+class FakeSocket:
+    """Socket stand-in that discards writes and serves reads from a byte buffer."""
+
+    def __init__(self, rx=b""):
+        self.rx = bytearray(rx)
+        self.tx_bytes = 0
+
+    def send(self, data):
+        self.tx_bytes += len(data)
+        return len(data)
+
+    def recv(self, n):
+        data = bytes(self.rx[:n])
+        del self.rx[:n]
+        return data
+
+    def settimeout(self, t):
+        pass
+
+    def close(self):
+        pass
+
@@ -0,0 +1,238 @@
+"""
+Local CPython stand-in for the hackathon WebSocket server.
+
+Speaks just enough RFC 6455 to drive TSEwebsocket clients: handshake with
+subprotocol selection, masked/unmasked frames, continuation frames and
+ping/pong. Faults can be injected to exercise the client:
+
+    delay_ms       added before every write to the client
+    chunk_size     split every write into TCP segments of at most this many bytes
+    fragment_size  send data messages as WebSocket fragments of this size
+    pong_delay_ms  hold pong replies to the client's pings (0 = immediate, None = never)
+
+Usage: python3 host_tools/ws_server.py [--port 8080] [--delay-ms N] [--chunk-size N]
+Run standalone it prints every message it receives and sends one keyboard
+state per line typed on stdin (e.g. "w", "wa", "" to release).
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class Connection:
+    """Server side of one client connection."""
+
+    def __init__(self, server, reader, writer, protocol):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.protocol = protocol
+        self.closed = False
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.pings_sent = {}
+        self.pong_rtts_ms = []
+        self._write_lock = asyncio.Lock()
+
+    async def _write(self, data):
+        async with self._write_lock:
+            if self.server.delay_ms:
+                await asyncio.sleep(self.server.delay_ms / 1000)
+            step = self.server.chunk_size or len(data)
+            for i in range(0, len(data), step):
+                self.writer.write(data[i:i + step])
+                await self.writer.drain()
+                if self.server.chunk_size:
+                    await asyncio.sleep(0)  # let each chunk go out as its own segment
+
+    @staticmethod
+    def frame(opcode, payload, fin=True):
+        header = bytearray([(0x80 if fin else 0x00) | opcode])
+        n = len(payload)
+        if n <= 125:
+            header.append(n)
+        elif n <= 65535:
+            header.append(126)
+            header += struct.pack(">H", n)
+        else:
+            header.append(127)
+            header += struct.pack(">Q", n)
+        return bytes(header) + bytes(payload)
+
+    async def send(self, payload, opcode=None):
+        """Send a data message, fragmented if the server is configured to."""
+        if isinstance(payload, str):
+            payload = payload.encode()
+            opcode = opcode or 0x1
+        opcode = opcode or 0x2
+        size = self.server.fragment_size
+        if not size or len(payload) <= size:
+            parts = [payload]
+        else:
+            parts = [payload[i:i + size] for i in range(0, len(payload), size)]
+        data = b"".join(self.frame(opcode if i == 0 else 0x0, part, i == len(parts) - 1)
+                        for i, part in enumerate(parts))
+        self.frames_sent += len(parts)
+        await self._write(data)
+
+    async def ping(self):
+        token = os.urandom(4)
+        self.pings_sent[token] = time.perf_counter()
+        await self._write(self.frame(0x9, token))
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                await self._write(self.frame(0x8, b""))
+            except ConnectionError:
+                pass
+            self.writer.close()
+
+    async def _read_frame(self):
+        byte1, byte2 = await self.reader.readexactly(2)
+        length = byte2 & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", await self.reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", await self.reader.readexactly(8))[0]
+        mask = await self.reader.readexactly(4) if byte2 & 0x80 else None
+        payload = await self.reader.readexactly(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return byte1 & 0x80, byte1 & 0x0F, payload
+
+    async def messages(self):
+        """Async generator of (opcode, payload) data messages from the client."""
+        frag_opcode, frag = None, b""
+        try:
+            while True:
+                fin, opcode, payload = await self._read_frame()
+                self.frames_received += 1
+                if opcode == 0x8:
+                    break
+                elif opcode == 0x9:
+                    asyncio.ensure_future(self._pong(payload))
+                elif opcode == 0xA:
+                    sent = self.pings_sent.pop(payload, None)
+                    if sent is not None:
+                        self.pong_rtts_ms.append((time.perf_counter() - sent) * 1000)
+                elif opcode == 0x0:
+                    frag += payload
+                    if fin:
+                        yield frag_opcode, frag
+                        frag_opcode, frag = None, b""
+                elif fin:
+                    yield opcode, payload
+                else:
+                    frag_opcode, frag = opcode, payload
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        self.closed = True
+
+    async def _pong(self, payload):
+        if self.server.pong_delay_ms is None:
+            return
+        if self.server.pong_delay_ms:
+            await asyncio.sleep(self.server.pong_delay_ms / 1000)
+        await self._write(self.frame(0xA, payload))
+
+
+class StandInServer:
+
+    def __init__(self, host="127.0.0.1", port=0, delay_ms=0, chunk_size=0, fragment_size=0,
+                 pong_delay_ms=0, protocols=("tse.control.v1", "tse.json")):
+        self.host = host
+        self.port = port
+        self.delay_ms = delay_ms
+        self.chunk_size = chunk_size
+        self.fragment_size = fragment_size
+        self.pong_delay_ms = pong_delay_ms
+        self.protocols = protocols
+        self.connections = asyncio.Queue()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handshake, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def accept(self):
+        """Wait for the next client to finish its handshake."""
+        return await self.connections.get()
+
+    async def _handshake(self, reader, writer):
+        request = await reader.readuntil(b"\r\n\r\n")
+        headers = {}
+        for line in request.decode().split("\r\n")[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1(headers["sec-websocket-key"].encode() + _GUID).digest())
+        response = (b"HTTP/1.1 101 Switching Protocols\r\n"
+                    b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                    b"Sec-WebSocket-Accept: " + accept + b"\r\n")
+        protocol = None
+        offered = [p.strip() for p in headers.get("sec-websocket-protocol", "").split(",") if p.strip()]
+        for p in self.protocols:
+            if p in offered:
+                protocol = p
+                break
+        if protocol:
+            response += b"Sec-WebSocket-Protocol: " + protocol.encode() + b"\r\n"
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        writer.write(response + b"\r\n")
+        await writer.drain()
+        await self.connections.put(Connection(self, reader, writer, protocol))
+
+
+async def _interactive(args):
+    server = await StandInServer(args.host, args.port, args.delay_ms, args.chunk_size,
+                                 args.fragment_size).start()
+    print(f"* Stand-in server on ws://{args.host}:{server.port}/ws")
+    loop = asyncio.get_running_loop()
+    while True:
+        conn = await server.accept()
+        print(f"* Client connected, protocol {conn.protocol}")
+
+        async def printer():
+            async for opcode, payload in conn.messages():
+                print(f"< {opcode:#x} {payload[:80]!r}")
+            print("* Client disconnected")
+
+        task = asyncio.ensure_future(printer())
+        while not conn.closed:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            keys = line.strip().lower()
+            await conn.send(json.dumps({k: k in keys for k in "wasd"} | {"servo": 90}))
+        await task
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--delay-ms", type=float, default=0)
+    parser.add_argument("--chunk-size", type=int, default=0)
+    parser.add_argument("--fragment-size", type=int, default=0)
+    asyncio.run(_interactive(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()